@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 from datetime import datetime
@@ -32,12 +32,38 @@ class SystemMetricsResponse(BaseModel):
     recent_alerts: int
 
 
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values (q=0 refuses)"""
+    gzip_q = None
+    wildcard_q = None
+    for coding in accept_encoding.lower().split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name in ("gzip", "x-gzip"):
+            gzip_q = q
+        elif name == "*":
+            wildcard_q = q
+    if gzip_q is None:
+        gzip_q = wildcard_q
+    return gzip_q is not None and gzip_q > 0
+
+
 @router.get("/metrics")
 async def get_prometheus_metrics(
+    request: Request,
     current_admin: Admin = Depends(get_current_active_admin)
 ):
     """Get Prometheus metrics"""
-    return metrics_service.get_metrics()
+    accept_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    return await metrics_service.get_metrics(accept_gzip=accept_gzip)
 
 
 @router.get("/system-metrics", response_model=SystemMetricsResponse)
@@ -22,6 +22,7 @@ class NginxConfigPreviewRequest(BaseModel):
     vps_id: str = Field(..., description="VPS ID")
     config_name: str = Field(default="default", description="Configuration name")
     config_type: str = Field(default="server_block", description="Configuration type")
+    fail_fast: bool = Field(default=False, description="Stop at the first forbidden directive or dangerous include")
 
 
 class NginxConfigCreateRequest(BaseModel):
@@ -130,6 +131,46 @@ async def get_nginx_config(
         )
 
 
+@router.get("/vps/{vps_id}/nginx/configs/{version}/diff")
+async def get_nginx_config_diff(
+    vps_id: str,
+    version: int,
+    mask_sensitive: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_admin: Admin = Depends(get_current_active_admin)
+):
+    """Get the unified diff of a nginx configuration version against the previous one"""
+    try:
+        audit_service = AuditService(db)
+        nginx_service = NginxConfigService(db, audit_service=audit_service)
+        
+        # Get config by version
+        configs = await nginx_service.get_config_versions(vps_id)
+        config = next((c for c in configs if c["version"] == version), None)
+        
+        if not config:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Configuration version not found"
+            )
+        
+        diff_lines = await nginx_service.get_config_diff(config["id"], mask_sensitive)
+        
+        return {
+            "config": config,
+            "diff": "".join(diff_lines)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get nginx config diff {vps_id}/{version}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve configuration diff"
+        )
+
+
 @router.post("/vps/{vps_id}/nginx/preview", response_model=ValidationResponse)
 async def preview_nginx_config(
     vps_id: str,
@@ -162,7 +203,7 @@ async def preview_nginx_config(
         
         # Validate configuration
         validation_result = await nginx_service.validate_config(
-            vps_id, request_data.content, dry_run=True
+            vps_id, request_data.content, dry_run=True, fail_fast=request_data.fail_fast
         )
         
         # Complete audit log
@@ -224,7 +265,7 @@ async def create_nginx_config(
         )
         
         # Create configuration version
-        config = await nginx_service.create_config_version(
+        config, created = await nginx_service.create_config_version(
             vps_id=vps_id,
             content=request_data.content,
             author_id=str(current_admin.id),
@@ -240,7 +281,8 @@ async def create_nginx_config(
             "success",
             result={
                 "config_id": str(config.id),
-                "version": config.version
+                "version": config.version,
+                "deduplicated": not created
             }
         )
         
@@ -249,7 +291,11 @@ async def create_nginx_config(
             "task_id": task_id,
             "config_id": str(config.id),
             "version": config.version,
-            "message": "Configuration version created successfully"
+            "deduplicated": not created,
+            "message": (
+                "Configuration version created successfully" if created
+                else "Content matches the latest version; no new version was created"
+            )
         }
         
     except Exception as e:
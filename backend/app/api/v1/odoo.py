@@ -66,6 +66,7 @@ class OdooTemplateListResponse(BaseModel):
     total: int
     page: int
     per_page: int
+    next_cursor: Optional[str] = None
 
 
 # Pydantic models for deployments
@@ -128,6 +129,7 @@ async def get_templates(
     complexity_level: Optional[str] = Query(None, pattern="^(beginner|intermediate|advanced)$"),
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, max_length=32),
     db: AsyncSession = Depends(get_db),
     current_admin: Admin = Depends(get_current_active_admin)
 ):
@@ -139,7 +141,8 @@ async def get_templates(
             version=version,
             is_public=is_public,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=cursor
         )
         
         templates = []
@@ -166,9 +169,15 @@ async def get_templates(
             templates=templates,
             total=result["total"],
             page=result["page"],
-            per_page=result["per_page"]
+            per_page=result["per_page"],
+            next_cursor=result["next_cursor"]
         )
         
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Failed to get templates: {e}")
         raise HTTPException(
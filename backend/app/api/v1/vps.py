@@ -8,6 +8,8 @@ from app.models.admin import Admin
 from app.services.vps_service import VPSService
 from app.services.ssh_service import SSHService
 from app.services.audit_service import AuditService
+from app.services.docker_service import invalidate_vps_cache
+from app.services.odoo_deployment_service import invalidate_host_info
 import logging
 
 logger = logging.getLogger(__name__)
@@ -307,6 +309,8 @@ async def delete_vps(
         # Delete VPS (cascade will handle related records)
         await db.delete(vps)
         await db.commit()
+        invalidate_vps_cache(vps_id)
+        invalidate_host_info(vps_id)
         
         await audit_service.complete_action(task_id, "success")
         
@@ -7,6 +7,11 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = Field(..., env="DATABASE_URL")
     DATABASE_TEST_URL: str = Field(default="", env="DATABASE_TEST_URL")
+    DB_POOL_SIZE: int = Field(default=25, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(default=25, env="DB_MAX_OVERFLOW")
+    DB_POOL_RECYCLE: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    DB_QUERY_CACHE_SIZE: int = Field(default=1200, env="DB_QUERY_CACHE_SIZE")
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = Field(default=500, env="DB_PREPARED_STATEMENT_CACHE_SIZE")
     
     # Redis
     REDIS_URL: str = Field(..., env="REDIS_URL")
@@ -27,6 +32,7 @@ class Settings(BaseSettings):
     # SSH
     SSH_PRIVATE_KEY_PATH: str = Field(default="/app/keys/id_rsa", env="SSH_PRIVATE_KEY_PATH")
     SSH_TIMEOUT: int = Field(default=30, env="SSH_TIMEOUT")
+    SSH_CONNECTION_IDLE_TIMEOUT: int = Field(default=300, env="SSH_CONNECTION_IDLE_TIMEOUT")
     
     # Nginx Configuration
     NGINX_CONFIG_WATCH_WINDOW_SECONDS: int = Field(default=120, env="NGINX_CONFIG_WATCH_WINDOW_SECONDS")
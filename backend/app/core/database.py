@@ -1,19 +1,27 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import event
+from sqlalchemy import event, text
 from .config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# asyncpg keeps a per-connection cache of prepared statements; size it so the
+# repeated lookups issued by the services stay prepared
+connect_args = {}
+if settings.DATABASE_URL.startswith("postgresql+asyncpg"):
+    connect_args["prepared_statement_cache_size"] = settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+
 # Create async engine
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
-    pool_recycle=300
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+    connect_args=connect_args
 )
 
 # Create async session factory
@@ -26,6 +34,26 @@ AsyncSessionLocal = async_sessionmaker(
 # Create declarative base for models
 Base = declarative_base()
 
+# Additive schema changes for tables that already exist (create_all only creates
+# missing tables). Each statement must be idempotent.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE nginx_configs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE nginx_configs ADD COLUMN IF NOT EXISTS validated_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE nginx_configs ADD COLUMN IF NOT EXISTS validated_hash VARCHAR(64)",
+    "ALTER TABLE nginx_configs ADD COLUMN IF NOT EXISTS diff_blob BYTEA",
+    "ALTER TABLE vps_hosts ADD COLUMN IF NOT EXISTS last_successful_config_id UUID",
+    "CREATE INDEX IF NOT EXISTS ix_nginx_configs_vps_version "
+    "ON nginx_configs (vps_id, version DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_nginx_configs_vps_status_applied "
+    "ON nginx_configs (vps_id, status, rollback_triggered, applied_at DESC)",
+    "DROP INDEX IF EXISTS ix_odoo_templates_public_industry_version",
+    "DROP INDEX IF EXISTS ix_odoo_templates_private_industry_version",
+    "CREATE INDEX IF NOT EXISTS ix_odoo_templates_public_listing "
+    "ON odoo_templates (industry, version, created_at, id) WHERE is_active AND is_public",
+    "CREATE INDEX IF NOT EXISTS ix_odoo_templates_private_listing "
+    "ON odoo_templates (industry, version, created_at, id) WHERE is_active AND NOT is_public",
+]
+
 
 async def get_db() -> AsyncSession:
     """Dependency to get database session"""
@@ -49,6 +77,10 @@ async def init_db():
             # Create all tables
             await conn.run_sync(Base.metadata.create_all)
             
+            # Apply additive upgrades to existing tables
+            for statement in SCHEMA_UPGRADES:
+                await conn.execute(text(statement))
+            
             logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
@@ -3,10 +3,16 @@ from typing import Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
+from cryptography.hazmat.backends.openssl.backend import backend as openssl_backend
 import base64
+import logging
+import os
+import re
 import secrets
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -27,9 +33,34 @@ def get_encryption_key() -> bytes:
     except Exception as e:
         raise ValueError(f"Invalid ENCRYPTION_KEY format. Must be a valid Fernet key (44 characters, base64 encoded): {str(e)}")
 
+# Built once at import; Fernet's AES-CBC/HMAC primitives run through OpenSSL's EVP
+# interface, which uses AES-NI when the CPU provides it
 cipher_suite = Fernet(get_encryption_key())
 
 
+def cpu_has_aes_ni() -> Optional[bool]:
+    """Report whether the CPU advertises AES-NI (None if it cannot be determined)"""
+    try:
+        with open("/proc/cpuinfo", "r") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("flags"):
+                    return "aes" in line.split(":", 1)[1].split()
+    except OSError:
+        pass
+    return None
+
+
+def log_crypto_backend() -> None:
+    """Log the OpenSSL build used for data encryption and whether AES-NI is available"""
+    aes_ni = cpu_has_aes_ni()
+    logger.info(
+        f"Encryption backend: {openssl_backend.openssl_version_text()}, "
+        f"AES-NI: {'unknown' if aes_ni is None else ('available' if aes_ni else 'not available')}"
+    )
+    if os.environ.get("OPENSSL_ia32cap"):
+        logger.warning("OPENSSL_ia32cap is set; OpenSSL CPU capability detection (including AES-NI) may be overridden")
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -82,8 +113,7 @@ def decrypt_data(encrypted_data: str) -> str:
         return decrypted_data.decode('utf-8')
     except Exception as e:
         # More detailed error for debugging
-        import logging
-        logging.getLogger(__name__).error(f"Failed to decrypt data: {str(e)}. This usually happens when the encryption key changes.")
+        logger.error(f"Failed to decrypt data: {str(e)}. This usually happens when the encryption key changes.")
         raise ValueError("Failed to decrypt data - encryption key may have changed")
 
 
@@ -92,20 +122,29 @@ def generate_secure_token(length: int = 32) -> str:
     return secrets.token_urlsafe(length)
 
 
-def sanitize_error_message(error: str, task_id: Optional[str] = None) -> dict:
-    """Sanitize error messages for safe logging and display"""
+# Patterns redacted from error messages
+_SENSITIVE_PATH_RE = re.compile(r'/[^\s]*/(config|secret|key|password)[^\s]*')
+_SENSITIVE_VALUE_RE = re.compile(r'(password|key|secret|token)[\s=:]+[^\s]+', re.IGNORECASE)
+
+
+def _redact_error_text(error: str) -> str:
+    """Redact paths and credentials from an error text"""
     # Remove potential sensitive information
     sanitized = error.replace('\n', ' ').strip()
     
     # Remove file paths that might contain sensitive info
-    import re
-    sanitized = re.sub(r'/[^\s]*/(config|secret|key|password)[^\s]*', '[REDACTED_PATH]', sanitized)
+    sanitized = _SENSITIVE_PATH_RE.sub('[REDACTED_PATH]', sanitized)
     
     # Remove potential passwords or keys
-    sanitized = re.sub(r'(password|key|secret|token)[\s=:]+[^\s]+', r'\1=[REDACTED]', sanitized, flags=re.IGNORECASE)
+    sanitized = _SENSITIVE_VALUE_RE.sub(r'\1=[REDACTED]', sanitized)
     
+    return sanitized[:500]  # Limit error message length
+
+
+def sanitize_error_message(error: str, task_id: Optional[str] = None) -> dict:
+    """Sanitize error messages for safe logging and display"""
     return {
-        "error": sanitized[:500],  # Limit error message length
+        "error": _redact_error_text(error),
         "task_id": task_id or generate_secure_token(8),
         "timestamp": datetime.utcnow().isoformat()
     }
\ No newline at end of file
@@ -2,14 +2,19 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
 from app.core.config import settings
 from app.core.database import init_db, close_db, AsyncSessionLocal
 from app.api.v1.api import api_router
 from app.services.metrics_service import create_metrics_middleware
-from app.core.security import get_password_hash
+from app.services.ssh_service import SSHService
+from app.services.audit_service import flush_audit_queue
+from app.core.security import get_password_hash, log_crypto_backend
 from app.models.admin import Admin
 
 # Configure logging
@@ -19,6 +24,14 @@ logging.basicConfig(
     stream=sys.stdout
 )
 
+# Hand log records to a background thread so request handlers never block on
+# writing to stdout
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, *logging.root.handlers, respect_handler_level=True)
+logging.root.handlers = [logging.handlers.QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
 
@@ -63,6 +76,7 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     logger.info("Starting SaaS Orchestration Platform")
+    log_crypto_backend()
     try:
         await init_db()
         logger.info("Database initialized successfully")
@@ -78,8 +92,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down SaaS Orchestration Platform")
+    await flush_audit_queue()
     await close_db()
     logger.info("Database connections closed")
+    SSHService().close_all_connections()
+    logger.info("SSH connections closed")
 
 
 # Create FastAPI application
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, JSON, ForeignKey, LargeBinary, Index
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.core.database import Base
 from .base import BaseModel
 
@@ -18,8 +18,10 @@ class NginxConfig(Base, BaseModel):
     
     # Configuration content (encrypted)
     content_encrypted = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the plaintext content
     summary = Column(Text, nullable=True)
-    diff_json = Column(JSON, nullable=True)  # Diff from previous version
+    diff_json = Column(JSON, nullable=True)  # Added/removed line counts vs previous version
+    diff_blob = deferred(Column(LargeBinary, nullable=True))  # zlib-compressed unified diff
     
     # Status and timestamps
     status = Column(String, default="draft", nullable=False)  # draft, applied, rolled_back, failed
@@ -33,6 +35,8 @@ class NginxConfig(Base, BaseModel):
     # Validation results
     nginx_test_result = Column(JSON, nullable=True)  # Result of nginx -t
     lint_result = Column(JSON, nullable=True)  # Custom linting results
+    validated_at = Column(DateTime(timezone=True), nullable=True)  # Last successful full validation
+    validated_hash = Column(String(64), nullable=True)  # Content hash that validation covered
     
     # Scheduling
     scheduled_apply_at = Column(DateTime(timezone=True), nullable=True)
@@ -49,6 +53,15 @@ class NginxConfig(Base, BaseModel):
     # Relationships
     vps_host = relationship("VPSHost", back_populates="nginx_configs")
     
+    # Lookups filter by VPS and order by version or by time of the last successful apply
+    __table_args__ = (
+        Index("ix_nginx_configs_vps_version", vps_id, version.desc()),
+        Index(
+            "ix_nginx_configs_vps_status_applied",
+            vps_id, status, rollback_triggered, applied_at.desc()
+        ),
+    )
+    
     def __repr__(self):
         return f"<NginxConfig(vps_id='{self.vps_id}', version={self.version}, status='{self.status}')>"
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, JSON, LargeBinary
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, JSON, LargeBinary, Index, true, false
 from sqlalchemy.dialects.postgresql import UUID
 from app.core.database import Base
 from .base import BaseModel
@@ -60,6 +60,21 @@ class OdooTemplate(Base, BaseModel):
     demo_url = Column(String, nullable=True)  # Demo instance URL
     documentation_url = Column(String, nullable=True)
     
+    # Partial indexes for the public and private template listings, ending in the
+    # (created_at, id) keyset the listings are paginated on
+    __table_args__ = (
+        Index(
+            "ix_odoo_templates_public_listing",
+            industry, version, "created_at", "id",
+            postgresql_where=(is_active == true()) & (is_public == true())
+        ),
+        Index(
+            "ix_odoo_templates_private_listing",
+            industry, version, "created_at", "id",
+            postgresql_where=(is_active == true()) & (is_public == false())
+        ),
+    )
+    
     def __repr__(self):
         return f"<OdooTemplate(name='{self.name}', industry='{self.industry}', version='{self.version}')>"
     
@@ -34,6 +34,7 @@ class VPSHost(Base, BaseModel):
     nginx_managed_dir = Column(String, default="/etc/nginx/managed.d", nullable=False)
     nginx_drafts_dir = Column(String, default="/etc/nginx/managed.d/drafts", nullable=False)
     nginx_config_checksum = Column(String, nullable=True)
+    last_successful_config_id = Column(UUID(as_uuid=True), nullable=True)  # Last known-good NginxConfig
     
     # Monitoring
     monitoring_enabled = Column(Boolean, default=True, nullable=False)
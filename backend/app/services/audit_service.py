@@ -1,10 +1,66 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, and_
+from sqlalchemy import select, desc, and_, insert
 from app.models.audit_log import AuditLog
+from app.core.database import AsyncSessionLocal
 from app.core.security import sanitize_error_message
 
+logger = logging.getLogger(__name__)
+
+# Entries queued with AuditService.enqueue are written by one background task per
+# event loop. It never waits to fill a batch: whatever is queued when it wakes up
+# (up to AUDIT_BATCH_MAX_SIZE) goes out in a single multi-row INSERT.
+AUDIT_QUEUE_MAX_SIZE = 10_000
+AUDIT_BATCH_MAX_SIZE = 100
+
+_audit_queue: Optional[asyncio.Queue] = None
+_audit_writer: Optional[asyncio.Task] = None
+_audit_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _write_queued_audit_logs(queue: asyncio.Queue):
+    """Drain the audit queue in batches until cancelled"""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < AUDIT_BATCH_MAX_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(AuditLog), batch)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} audit log entries: {e}")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def _get_audit_queue() -> asyncio.Queue:
+    """Return the audit queue of the running event loop, starting its writer on first use"""
+    global _audit_queue, _audit_writer, _audit_loop
+    
+    loop = asyncio.get_running_loop()
+    if _audit_queue is None or _audit_loop is not loop:
+        _audit_queue = asyncio.Queue(maxsize=AUDIT_QUEUE_MAX_SIZE)
+        _audit_writer = loop.create_task(_write_queued_audit_logs(_audit_queue))
+        _audit_loop = loop
+    return _audit_queue
+
+
+async def flush_audit_queue():
+    """Wait until every queued audit entry has been written, then stop the writer"""
+    global _audit_queue, _audit_writer, _audit_loop
+    
+    if _audit_queue is None or _audit_loop is not asyncio.get_running_loop():
+        return
+    await _audit_queue.join()
+    _audit_writer.cancel()
+    _audit_queue = _audit_writer = _audit_loop = None
+
 
 class AuditService:
     """Service for comprehensive audit logging"""
@@ -49,6 +105,96 @@ class AuditService:
         
         return audit_log
     
+    async def enqueue(
+        self,
+        task_id: str,
+        action: str,
+        resource_type: str,
+        description: str,
+        actor_id: Optional[str] = None,
+        resource_id: Optional[str] = None,
+        actor_ip: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+        status: str = "pending"
+    ):
+        """Queue a new action for the background writer instead of inserting it now.
+        
+        Only waits when the queue is full, so callers are slowed down rather than
+        entries dropped if the database falls behind.
+        """
+        
+        await _get_audit_queue().put({
+            "task_id": task_id,
+            "action": action,
+            "resource_type": resource_type,
+            "resource_id": resource_id,
+            "actor_id": actor_id,
+            "actor_ip": actor_ip,
+            "user_agent": user_agent,
+            "description": description,
+            "details": details,
+            "status": status,
+            "started_at": datetime.now(timezone.utc),
+            "context": context
+        })
+    
+    async def log_complete(
+        self,
+        task_id: str,
+        action: str,
+        resource_type: str,
+        description: str,
+        status: str,
+        started_at: datetime,
+        actor_id: Optional[str] = None,
+        resource_id: Optional[str] = None,
+        actor_ip: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+        result: Optional[Dict[str, Any]] = None,
+        error_message: Optional[str] = None,
+        commit: bool = True
+    ) -> AuditLog:
+        """Log an action that has already finished in a single write.
+        
+        With commit=False the entry is only added to the session, so it is written
+        by the caller's next commit together with its other changes.
+        """
+        
+        completed_at = datetime.now(timezone.utc)
+        
+        audit_log = AuditLog(
+            task_id=task_id,
+            action=action,
+            resource_type=resource_type,
+            resource_id=resource_id,
+            actor_id=actor_id,
+            actor_ip=actor_ip,
+            user_agent=user_agent,
+            description=description,
+            details=details,
+            status=status,
+            started_at=started_at,
+            completed_at=completed_at,
+            duration_seconds=int((completed_at - started_at).total_seconds()),
+            result=result,
+            context=context
+        )
+        
+        if error_message:
+            # Sanitize error message before storing
+            audit_log.error_message = sanitize_error_message(error_message, task_id)["error"]
+        
+        self.db.add(audit_log)
+        if commit:
+            await self.db.commit()
+            await self.db.refresh(audit_log)
+        
+        return audit_log
+    
     async def complete_action(
         self,
         task_id: str,
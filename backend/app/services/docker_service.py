@@ -1,16 +1,66 @@
-from typing import Dict, List, Optional, Any
-import json
+from typing import Dict, List, Optional, Any, Tuple
+import asyncio
 import logging
+import time
+import orjson
 from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.vps_host import VPSHost
 from app.services.ssh_service import SSHService
 from app.services.audit_service import AuditService
-from app.core.security import decrypt_data, generate_secure_token
+from app.services.metrics_service import metrics_service
+from app.core.security import generate_secure_token
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of concurrent SSH channels used for Docker status probes
+DOCKER_PROBE_CONCURRENCY = 4
+
+# Short-lived cache of VPS host rows, keyed by VPS id: {vps_id: (expires_at, VPSHost)}
+VPS_CACHE_TTL_SECONDS = 30
+VPS_CACHE_MAX_SIZE = 256
+_vps_cache: Dict[str, Tuple[float, VPSHost]] = {}
+
+
+def invalidate_vps_cache(vps_id: Optional[str] = None) -> None:
+    """Drop a cached VPS host row, or the whole cache when no ID is given"""
+    if vps_id is None:
+        _vps_cache.clear()
+    else:
+        _vps_cache.pop(str(vps_id), None)
+
+
+# Tab-separated Go templates that ask Docker for only the fields we return
+CONTAINER_LIST_FORMAT = r"{{.ID}}\t{{.Names}}\t{{.Image}}\t{{.Status}}\t{{.CreatedAt}}\t{{.Ports}}\t{{.Labels}}"
+CONTAINER_LIST_FIELDS = 7
+IMAGE_LIST_FORMAT = r"{{.ID}}\t{{.Repository}}\t{{.Tag}}\t{{.CreatedAt}}\t{{.Size}}"
+IMAGE_LIST_FIELDS = 5
+
+VALID_CONTAINER_ACTIONS = frozenset({"start", "stop", "restart", "remove", "pause", "unpause"})
+
+# Separates a container action's own output from the status check appended to it
+CONTAINER_STATUS_MARKER = "__SAAS_CONTAINER_STATUS__"
+
+
+def _iter_format_rows(output: str, field_count: int, label: str):
+    """Lazily split tab-separated Docker CLI output into field tuples"""
+    pos = 0
+    end = len(output)
+    while pos < end:
+        newline = output.find('\n', pos)
+        if newline == -1:
+            newline = end
+        line = output[pos:newline]
+        pos = newline + 1
+        if not line.strip():
+            continue
+        fields = line.split('\t', field_count - 1)
+        if len(fields) != field_count:
+            logger.error(f"Failed to parse {label} row: expected {field_count} fields, got {len(fields)}")
+            continue
+        yield fields
+
 
 class DockerService:
     """Service for managing Docker operations on VPS hosts"""
@@ -20,10 +70,26 @@ class DockerService:
         self.audit_service = audit_service
     
     async def get_vps(self, vps_id: str, db: AsyncSession) -> Optional[VPSHost]:
-        """Get VPS host by ID"""
+        """Get VPS host by ID (served from a short-lived cache when possible)"""
+        key = str(vps_id)
+        now = time.monotonic()
+        cached = _vps_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        
         query = select(VPSHost).where(VPSHost.id == vps_id)
         result = await db.execute(query)
-        return result.scalar_one_or_none()
+        vps = result.scalar_one_or_none()
+        
+        if vps:
+            # Cache a detached copy so the entry never depends on this session's state
+            if len(_vps_cache) >= VPS_CACHE_MAX_SIZE:
+                _vps_cache.pop(next(iter(_vps_cache)), None)
+            _vps_cache[key] = (now + VPS_CACHE_TTL_SECONDS, VPSHost(**vps.to_dict()))
+        else:
+            _vps_cache.pop(key, None)
+        
+        return vps
     
     async def get_docker_status(self, vps_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Get Docker status and system information"""
@@ -32,10 +98,6 @@ class DockerService:
             raise ValueError("VPS not found")
         
         try:
-            # Get decrypted credentials
-            password = decrypt_data(vps.password_encrypted) if vps.password_encrypted else None
-            private_key = decrypt_data(vps.private_key_encrypted) if vps.private_key_encrypted else None
-            
             # Connect via SSH  
             host_info = {
                 'ip_address': vps.ip_address,
@@ -74,45 +136,35 @@ class DockerService:
                     "system_info": {"error": "Docker not installed on host"}
                 }
 
-            # Get Docker version (Docker is present)
-            version_result = await self.ssh_service.execute_command(
-                vps.id, "docker --version", host_info=host_info
+            # The remaining probes are independent, so run them concurrently over
+            # the shared SSH transport (bounded to avoid exhausting channels)
+            probe_semaphore = asyncio.Semaphore(DOCKER_PROBE_CONCURRENCY)
+
+            async def run_probe(command: str) -> Dict[str, Any]:
+                async with probe_semaphore:
+                    return await self.ssh_service.execute_command(vps.id, command, host_info=host_info)
+
+            version_result, info_result, status_result = await asyncio.gather(
+                run_probe("docker --version"),
+                run_probe("docker system info --format json"),
+                run_probe("docker info > /dev/null 2>&1 && echo 'running' || echo 'stopped'"),
             )
+
             docker_version = version_result.get("stdout", "Unknown").strip() or "Unknown"
             
-            # Get Docker system info
-            info_result = await self.ssh_service.execute_command(
-                vps.id, "docker system info --format json", host_info=host_info
-            )
-            
             system_info = {}
             if info_result.get("success") and info_result.get("stdout"):
                 try:
-                    system_info = json.loads(info_result["stdout"])
-                except json.JSONDecodeError:
+                    system_info = orjson.loads(info_result["stdout"])
+                except orjson.JSONDecodeError:
                     system_info = {"error": "Failed to parse Docker info"}
             
-            # Get container counts
-            running_result = await self.ssh_service.execute_command(
-                vps.id, "docker ps -q | wc -l", host_info=host_info
-            )
-            containers_running = int(running_result.get("stdout", "0").strip())
-            
-            total_result = await self.ssh_service.execute_command(
-                vps.id, "docker ps -aq | wc -l", host_info=host_info
-            )
-            containers_total = int(total_result.get("stdout", "0").strip())
-            
-            # Get image count
-            images_result = await self.ssh_service.execute_command(
-                vps.id, "docker images -q | wc -l", host_info=host_info
-            )
-            images_count = int(images_result.get("stdout", "0").strip())
+            # Container and image counts are already part of the system info
+            containers_running = int(system_info.get("ContainersRunning", 0) or 0)
+            containers_total = int(system_info.get("Containers", 0) or 0)
+            images_count = int(system_info.get("Images", 0) or 0)
             
             # Check if Docker daemon is running
-            status_result = await self.ssh_service.execute_command(
-                vps.id, "docker info > /dev/null 2>&1 && echo 'running' || echo 'stopped'", host_info=host_info
-            )
             docker_status = status_result.get("stdout", "unknown").strip()
             
             
@@ -145,9 +197,6 @@ class DockerService:
             raise ValueError("VPS not found")
         
         try:
-            password = decrypt_data(vps.password_encrypted) if vps.password_encrypted else None
-            private_key = decrypt_data(vps.private_key_encrypted) if vps.private_key_encrypted else None
-            
             host_info = {
                 'ip_address': vps.ip_address,
                 'port': vps.port,
@@ -160,56 +209,47 @@ class DockerService:
             if not ssh_client:
                 return {"success": False, "containers": []}
             
-            # Get containers in JSON format
+            # Get containers with only the fields we need
             flag = "-a" if all_containers else ""
             result = await self.ssh_service.execute_command(
-                vps.id, f"docker ps {flag} --format json", host_info=host_info
+                vps.id, f"docker ps {flag} --format '{CONTAINER_LIST_FORMAT}'", host_info=host_info
             )
             
             containers = []
             if result.get("success") and result.get("stdout"):
-                lines = result["stdout"].strip().split('\n')
-                for line in lines:
-                    if line.strip():
-                        try:
-                            container_data = json.loads(line)
-                            
-                            # Parse ports
-                            ports = []
-                            if container_data.get("Ports"):
-                                ports = [p.strip() for p in container_data["Ports"].split(',')]
-                            
-                            # Parse labels
-                            labels = {}
-                            if container_data.get("Labels"):
-                                label_pairs = container_data["Labels"].split(',')
-                                for pair in label_pairs:
-                                    if '=' in pair:
-                                        key, value = pair.split('=', 1)
-                                        labels[key.strip()] = value.strip()
+                append = containers.append
+                # `docker ps` already prints 12-char IDs and names without the leading '/'
+                for (
+                    container_id, name, image, status, created, ports_field, labels_field
+                ) in _iter_format_rows(result["stdout"], CONTAINER_LIST_FIELDS, "container"):
+                    # Parse ports
+                    ports = [p.strip() for p in ports_field.split(',')] if ports_field else []
+                    
+                    # Parse labels
+                    labels = {}
+                    if labels_field:
+                        for key, sep, value in (pair.partition('=') for pair in labels_field.split(',')):
+                            if sep:
+                                labels[key.strip()] = value.strip()
 
-                            # If ports missing but custom label present, synthesize from label
-                            if not ports:
-                                labeled_port = labels.get("saas.port")
-                                if labeled_port:
-                                    lp = str(labeled_port).strip()
-                                    if lp:
-                                        ports = [
-                                            f"0.0.0.0:{lp}->{lp}/tcp",
-                                            f":::{lp}->{lp}/tcp",
-                                        ]
-                            
-                            containers.append({
-                                "id": container_data.get("ID", "")[:12],
-                                "name": container_data.get("Names", "").lstrip('/'),
-                                "image": container_data.get("Image", ""),
-                                "status": container_data.get("Status", ""),
-                                "created": container_data.get("CreatedAt", ""),
-                                "ports": ports,
-                                "labels": labels
-                            })
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Failed to parse container JSON: {e}")
+                    # If ports missing but custom label present, synthesize from label
+                    if not ports:
+                        lp = labels.get("saas.port")
+                        if lp:
+                            ports = [
+                                f"0.0.0.0:{lp}->{lp}/tcp",
+                                f":::{lp}->{lp}/tcp",
+                            ]
+                    
+                    append({
+                        "id": container_id,
+                        "name": name,
+                        "image": image,
+                        "status": status,
+                        "created": created,
+                        "ports": ports,
+                        "labels": labels
+                    })
             
             # Fallback: enrich ports using docker inspect for containers with missing ports
             try:
@@ -221,7 +261,7 @@ class DockerService:
                     inspect_result = await self.ssh_service.execute_command(vps.id, inspect_cmd, host_info=host_info)
                     if inspect_result.get("success") and inspect_result.get("stdout"):
                         try:
-                            inspect_data = json.loads(inspect_result["stdout"])  # list of dicts
+                            inspect_data = orjson.loads(inspect_result["stdout"])  # list of dicts
                             # Build map from 12-char id prefix to derived port strings
                             ports_by_id: Dict[str, List[str]] = {}
                             for item in inspect_data:
@@ -267,7 +307,7 @@ class DockerService:
                             for c in containers:
                                 if not c.get("ports") and c["id"] in ports_by_id:
                                     c["ports"] = ports_by_id[c["id"]]
-                        except json.JSONDecodeError:
+                        except orjson.JSONDecodeError:
                             # ignore if inspect output is not JSON (shouldn't happen)
                             pass
             except Exception as e:
@@ -284,15 +324,22 @@ class DockerService:
     
     async def container_action(self, vps_id: str, db: AsyncSession, container_id: str, action: str, actor_id: str) -> Dict[str, Any]:
         """Perform action on Docker container"""
+        # Reject unknown actions before touching the database or SSH
+        if action not in VALID_CONTAINER_ACTIONS:
+            metrics_service.record_invalid_container_action()
+            return {"success": False, "message": f"Invalid action: {action}"}
+        
         vps = await self.get_vps(vps_id, db)
         if not vps:
             raise ValueError("VPS not found")
         
         task_id = generate_secure_token(8)
         
-        # Log the action
+        # Log the action without holding up the Docker work; it is awaited
+        # before the entry is completed so the session is never used concurrently
+        audit_task = None
         if self.audit_service:
-            await self.audit_service.log_action(
+            audit_task = asyncio.create_task(self.audit_service.log_action(
                 task_id=task_id,
                 action=f"docker_container_{action}",
                 resource_type="docker_container",
@@ -305,12 +352,19 @@ class DockerService:
                     "container_id": container_id,
                     "action": action
                 }
-            )
+            ))
+        
+        async def complete_audit(status: str, **kwargs) -> None:
+            if not audit_task:
+                return
+            try:
+                await audit_task
+            except Exception as e:
+                logger.error(f"Failed to write audit log for task {task_id}: {e}")
+                return
+            await self.audit_service.complete_action(task_id, status, **kwargs)
         
         try:
-            password = decrypt_data(vps.password_encrypted) if vps.password_encrypted else None
-            private_key = decrypt_data(vps.private_key_encrypted) if vps.private_key_encrypted else None
-            
             host_info = {
                 'ip_address': vps.ip_address,
                 'port': vps.port,
@@ -321,17 +375,9 @@ class DockerService:
             ssh_client = await self.ssh_service.get_connection(vps.id, host_info)
             
             if not ssh_client:
-                if self.audit_service:
-                    await self.audit_service.complete_action(task_id, "failed", error_message="Cannot connect to VPS")
+                await complete_audit("failed", error_message="Cannot connect to VPS")
                 return {"success": False, "message": "Cannot connect to VPS"}
             
-            # Execute Docker command
-            valid_actions = ["start", "stop", "restart", "remove", "pause", "unpause"]
-            if action not in valid_actions:
-                if self.audit_service:
-                    await self.audit_service.complete_action(task_id, "failed", error_message=f"Invalid action: {action}")
-                return {"success": False, "message": f"Invalid action: {action}"}
-            
             # Build Docker command with proper handling for different actions
             if action == "stop":
                 # Disable restart policy first, then stop container
@@ -342,31 +388,34 @@ class DockerService:
             else:
                 docker_cmd = f"docker {action} {container_id}"
             
+            # Verify the resulting container status in the same round-trip
+            verify = action in ("stop", "start", "restart")
+            if verify:
+                docker_cmd = (
+                    f"{docker_cmd} && echo {CONTAINER_STATUS_MARKER} && "
+                    f"docker ps -a --filter id={container_id} --format '{{{{.Status}}}}'"
+                )
+            
             result = await self.ssh_service.execute_command(vps.id, docker_cmd, host_info=host_info)
             
             if result.get("success"):
-                # Verify the action was successful by checking container status
                 verification_msg = ""
-                if action in ["stop", "start", "restart"]:
-                    verify_cmd = f"docker ps -a --filter id={container_id} --format 'table {{.Status}}'"
-                    verify_result = await self.ssh_service.execute_command(vps.id, verify_cmd, host_info=host_info)
-                    if verify_result.get("success") and verify_result.get("stdout"):
-                        status_output = verify_result["stdout"].strip()
+                if verify:
+                    _, marker, status_output = result.get("stdout", "").partition(CONTAINER_STATUS_MARKER)
+                    status_output = status_output.strip()
+                    if marker and status_output:
                         verification_msg = f" (Verified: {status_output})"
                 
-                if self.audit_service:
-                    await self.audit_service.complete_action(task_id, "success", result={"action": action, "container_id": container_id})
+                await complete_audit("success", result={"action": action, "container_id": container_id})
                 return {"success": True, "message": f"Container {action} successful{verification_msg}", "task_id": task_id}
             else:
                 error_msg = result.get("stderr", "Unknown error")
-                if self.audit_service:
-                    await self.audit_service.complete_action(task_id, "failed", error_message=error_msg)
+                await complete_audit("failed", error_message=error_msg)
                 return {"success": False, "message": error_msg}
                 
         except Exception as e:
             logger.error(f"Failed to {action} container {container_id}: {e}")
-            if self.audit_service:
-                await self.audit_service.complete_action(task_id, "failed", error_message=str(e))
+            await complete_audit("failed", error_message=str(e))
             return {"success": False, "message": str(e)}
     
     async def get_images(self, vps_id: str, db: AsyncSession) -> Dict[str, Any]:
@@ -376,9 +425,6 @@ class DockerService:
             raise ValueError("VPS not found")
         
         try:
-            password = decrypt_data(vps.password_encrypted) if vps.password_encrypted else None
-            private_key = decrypt_data(vps.private_key_encrypted) if vps.private_key_encrypted else None
-            
             host_info = {
                 'ip_address': vps.ip_address,
                 'port': vps.port,
@@ -391,27 +437,24 @@ class DockerService:
             if not ssh_client:
                 return {"success": False, "images": []}
             
-            # Get images in JSON format
+            # Get images with only the fields we need
             result = await self.ssh_service.execute_command(
-                vps.id, "docker images --format json", host_info=host_info
+                vps.id, f"docker images --format '{IMAGE_LIST_FORMAT}'", host_info=host_info
             )
             
             images = []
             if result.get("success") and result.get("stdout"):
-                lines = result["stdout"].strip().split('\n')
-                for line in lines:
-                    if line.strip():
-                        try:
-                            image_data = json.loads(line)
-                            images.append({
-                                "id": image_data.get("ID", "")[:12],
-                                "repository": image_data.get("Repository", ""),
-                                "tag": image_data.get("Tag", ""),
-                                "created": image_data.get("CreatedAt", ""),
-                                "size": image_data.get("Size", "")
-                            })
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Failed to parse image JSON: {e}")
+                # `docker images` already prints 12-char image IDs
+                for image_id, repository, tag, created, size in _iter_format_rows(
+                    result["stdout"], IMAGE_LIST_FIELDS, "image"
+                ):
+                    images.append({
+                        "id": image_id,
+                        "repository": repository,
+                        "tag": tag,
+                        "created": created,
+                        "size": size
+                    })
             
             
             return {
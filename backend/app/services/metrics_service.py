@@ -1,5 +1,9 @@
 from prometheus_client import Counter, Histogram, Gauge, start_http_server, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+from functools import lru_cache
+import asyncio
+import gzip
+import re
 import time
 import logging
 from fastapi import Response
@@ -7,12 +11,39 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Matches UUID and numeric path segments so they can be replaced with a placeholder
+_PATH_ID_RE = re.compile(
+    r'/(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)'
+)
+
+# Upper bound on cached (method, endpoint, status) label children
+HTTP_LABEL_CACHE_MAX_SIZE = 4096
+
+# How long a rendered metrics exposition is reused for subsequent scrapes
+METRICS_RENDER_TTL_SECONDS = 1.0
+
+# Prometheus scrape endpoints, which are not themselves recorded as HTTP traffic
+METRICS_SCRAPE_PATHS = frozenset({"/metrics", f"{settings.API_V1_STR}/monitoring/metrics"})
+
+
+@lru_cache(maxsize=2048)
+def _normalize_path(path: str) -> str:
+    """Normalize path for metrics (replace IDs with placeholders)"""
+    # Replace UUIDs and numeric IDs with placeholders in a single pass.
+    # Results are memoized; the bounded size keeps arbitrary client paths from growing it.
+    return _PATH_ID_RE.sub('/{id}', path)
+
 
 class MetricsService:
     """Service for collecting and exposing Prometheus metrics"""
     
     def __init__(self):
         self.registry = CollectorRegistry()
+        # Bound label children for HTTP metrics: {(method, endpoint, status): (counter, histogram)}
+        self._http_request_children: Dict[Tuple[str, str, int], Tuple[Any, Any]] = {}
+        # Last rendered exposition, reused by scrapes within the render TTL:
+        # (rendered_at, body, gzip-compressed body or None until first requested)
+        self._rendered_metrics: Tuple[float, bytes, Optional[bytes]] = (float("-inf"), b"", None)
         self._init_metrics()
         
     def _init_metrics(self):
@@ -76,6 +107,13 @@ class MetricsService:
             registry=self.registry
         )
         
+        # Docker management metrics
+        self.docker_invalid_container_actions_total = Counter(
+            'docker_invalid_container_actions_total',
+            'Total rejected Docker container actions with an unknown action name',
+            registry=self.registry
+        )
+        
         # Authentication metrics
         self.auth_attempts_total = Counter(
             'auth_attempts_total',
@@ -127,16 +165,26 @@ class MetricsService:
     
     def record_http_request(self, method: str, endpoint: str, status: int, duration: float):
         """Record HTTP request metrics"""
-        self.http_requests_total.labels(
-            method=method, 
-            endpoint=endpoint, 
-            status=str(status)
-        ).inc()
+        key = (method, endpoint, status)
+        children = self._http_request_children.get(key)
+        if children is None:
+            children = (
+                self.http_requests_total.labels(
+                    method=method, 
+                    endpoint=endpoint, 
+                    status=str(status)
+                ),
+                self.http_request_duration_seconds.labels(
+                    method=method, 
+                    endpoint=endpoint
+                )
+            )
+            if len(self._http_request_children) < HTTP_LABEL_CACHE_MAX_SIZE:
+                self._http_request_children[key] = children
         
-        self.http_request_duration_seconds.labels(
-            method=method, 
-            endpoint=endpoint
-        ).observe(duration)
+        requests_child, duration_child = children
+        requests_child.inc()
+        duration_child.observe(duration)
     
     def record_nginx_operation(self, operation: str, status: str, vps_id: str, duration: Optional[float] = None):
         """Record nginx configuration operation"""
@@ -168,6 +216,10 @@ class MetricsService:
         """Record VPS connection error"""
         self.vps_connection_errors_total.labels(vps_id=vps_id).inc()
     
+    def record_invalid_container_action(self):
+        """Record a rejected Docker container action"""
+        self.docker_invalid_container_actions_total.inc()
+    
     def record_auth_attempt(self, status: str, reason: Optional[str] = None):
         """Record authentication attempt"""
         self.auth_attempts_total.labels(status=status).inc()
@@ -192,10 +244,29 @@ class MetricsService:
             task_type=task_type
         ).observe(duration)
     
-    def get_metrics(self) -> Response:
-        """Get metrics in Prometheus format"""
-        data = generate_latest(self.registry)
-        return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+    async def get_metrics(self, accept_gzip: bool = False) -> Response:
+        """Get metrics in Prometheus format, gzip-compressed when the client accepts it"""
+        rendered_at, data, compressed = self._rendered_metrics
+        now = time.monotonic()
+        loop = asyncio.get_event_loop()
+        if now - rendered_at >= METRICS_RENDER_TTL_SECONDS:
+            # Serializing the registry is CPU-bound, keep it off the event loop
+            data = await loop.run_in_executor(None, generate_latest, self.registry)
+            compressed = None
+            rendered_at = now
+        
+        if not accept_gzip:
+            self._rendered_metrics = (rendered_at, data, compressed)
+            return Response(content=data, media_type=CONTENT_TYPE_LATEST, headers={"Vary": "Accept-Encoding"})
+        
+        if compressed is None:
+            compressed = await loop.run_in_executor(None, gzip.compress, data)
+        self._rendered_metrics = (rendered_at, data, compressed)
+        return Response(
+            content=compressed,
+            media_type=CONTENT_TYPE_LATEST,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
     
     def start_metrics_server(self, port: int = 8001):
         """Start standalone metrics server (for development)"""
@@ -220,17 +291,20 @@ class MetricsMiddleware:
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
         
-        start_time = time.time()
-        method = scope["method"]
         path = scope["path"]
+        if path in METRICS_SCRAPE_PATHS:
+            return await self.app(scope, receive, send)
+        
+        start_time = time.perf_counter()
+        method = scope["method"]
         
         # Normalize path for metrics (remove IDs)
-        normalized_path = self._normalize_path(path)
+        normalized_path = _normalize_path(path)
         
         async def send_wrapper(message):
             if message["type"] == "http.response.start":
                 status_code = message["status"]
-                duration = time.time() - start_time
+                duration = time.perf_counter() - start_time
                 
                 metrics_service.record_http_request(
                     method=method,
@@ -242,16 +316,6 @@ class MetricsMiddleware:
             await send(message)
         
         return await self.app(scope, receive, send_wrapper)
-    
-    def _normalize_path(self, path: str) -> str:
-        """Normalize path for metrics (replace IDs with placeholders)"""
-        import re
-        
-        # Replace UUIDs and numeric IDs with placeholders
-        path = re.sub(r'/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', '/{id}', path)
-        path = re.sub(r'/\d+', '/{id}', path)
-        
-        return path
 
 
 def create_metrics_middleware(app):
@@ -1,15 +1,138 @@
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, and_
+from sqlalchemy import select, update, desc, and_, bindparam
 from app.models.nginx_config import NginxConfig
 from app.models.vps_host import VPSHost
 from app.core.security import encrypt_data, decrypt_data, sanitize_error_message, generate_secure_token
 from app.services.nginx_validator import NginxConfigValidator, ValidationResult
 from app.services.audit_service import AuditService
+from collections import OrderedDict
 import difflib
+import hashlib
 import json
 import asyncio
+import re
+import shlex
+import zlib
+
+
+# Exit status used by the apply script to report a failed `nginx -t`
+NGINX_TEST_FAILED_EXIT_CODE = 90
+
+# How long a successful full validation of unchanged content is trusted by apply_config
+VALIDATION_REUSE_SECONDS = 300
+
+# Statuses of a version that an identical resubmission is deduplicated against
+_LIVE_CONFIG_STATUSES = frozenset({"draft", "validated", "applied"})
+
+# zlib level for stored diffs; config diffs are small, so favour speed
+DIFF_COMPRESSION_LEVEL = 3
+
+# Recently decrypted config contents: {config_id: (content_encrypted, plaintext)}.
+# Entries are only reused while the stored ciphertext is unchanged.
+PLAINTEXT_CACHE_MAX_SIZE = 32
+_plaintext_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _cache_plaintext(config_id: str, content_encrypted: str, plaintext: str) -> None:
+    """Remember decrypted content for a config, evicting the least recently used entry"""
+    _plaintext_cache[config_id] = (content_encrypted, plaintext)
+    _plaintext_cache.move_to_end(config_id)
+    while len(_plaintext_cache) > PLAINTEXT_CACHE_MAX_SIZE:
+        _plaintext_cache.popitem(last=False)
+
+
+def hash_config_content(content: str) -> str:
+    """Get the SHA-256 hex digest of plaintext config content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)((?:,\d+)?) \+(\d+)((?:,\d+)?) @@')
+
+
+def _unified_diff(old_lines: List[str], new_lines: List[str], fromfile: str, tofile: str, context: int = 3):
+    """Unified diff that only runs difflib over the region where the inputs differ.
+    
+    Leading and trailing lines common to both sides (beyond the context window) are
+    trimmed first, which keeps SequenceMatcher's quadratic matching off the unchanged
+    bulk of a config; hunk line numbers are shifted back afterwards.
+    """
+    max_common = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < max_common and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < max_common - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    
+    start = max(0, prefix - context)
+    trailing = max(0, suffix - context)
+    diff = difflib.unified_diff(
+        old_lines[start:len(old_lines) - trailing],
+        new_lines[start:len(new_lines) - trailing],
+        fromfile=fromfile,
+        tofile=tofile,
+        n=context
+    )
+    if not start:
+        yield from diff
+        return
+    
+    def shift(match) -> str:
+        return f"@@ -{int(match[1]) + start}{match[2]} +{int(match[3]) + start}{match[4]} @@"
+    
+    for line in diff:
+        if line.startswith('@@'):
+            line = _HUNK_HEADER_RE.sub(shift, line, count=1)
+        yield line
+
+
+# Patterns used to mask sensitive content
+_AUTH_FILE_RE = re.compile(r'(auth_basic_user_file\s+)[^;\n]+', re.IGNORECASE)
+_CERTIFICATE_RE = re.compile(r'(-----BEGIN [^-]+-----)(.*?)(-----END [^-]+-----)', re.DOTALL)
+
+# Statements used by the lookup helpers, built once so SQLAlchemy's compiled cache is hit
+_LATEST_CONFIG_QUERY = (
+    select(NginxConfig)
+    .where(NginxConfig.vps_id == bindparam("vps_id"))
+    .order_by(desc(NginxConfig.version))
+    .limit(1)
+)
+
+_CONFIG_BY_ID_QUERY = select(NginxConfig).where(NginxConfig.id == bindparam("config_id"))
+
+_CONFIG_DIFF_QUERY = select(NginxConfig.diff_blob).where(NginxConfig.id == bindparam("config_id"))
+
+_CONFIG_BY_VERSION_QUERY = (
+    select(NginxConfig)
+    .where(and_(
+        NginxConfig.vps_id == bindparam("vps_id"),
+        NginxConfig.version == bindparam("version")
+    ))
+)
+
+# Follows the denormalized VPSHost pointer; yields nothing if that config is no longer good
+_KNOWN_GOOD_CONFIG_QUERY = (
+    select(NginxConfig)
+    .join(VPSHost, VPSHost.last_successful_config_id == NginxConfig.id)
+    .where(and_(
+        VPSHost.id == bindparam("vps_id"),
+        NginxConfig.status == "applied",
+        NginxConfig.rollback_triggered == False
+    ))
+)
+
+_LAST_SUCCESSFUL_CONFIG_QUERY = (
+    select(NginxConfig)
+    .where(and_(
+        NginxConfig.vps_id == bindparam("vps_id"),
+        NginxConfig.status == "applied",
+        NginxConfig.rollback_triggered == False
+    ))
+    .order_by(desc(NginxConfig.applied_at))
+    .limit(1)
+)
 
 
 class NginxConfigService:
@@ -30,23 +153,43 @@ class NginxConfigService:
         config_name: str = "default",
         config_type: str = "server_block",
         template_used: Optional[str] = None
-    ) -> NginxConfig:
-        """Create a new configuration version"""
+    ) -> Tuple[NginxConfig, bool]:
+        """Create a new configuration version.
+        
+        Returns the version and whether it was created. An identical resubmission of
+        a latest version that is still live returns that version instead.
+        """
+        
+        # Get the previous version (if any) in a single round-trip
+        previous_config = await self._get_latest_config(vps_id)
         
-        # Get current version number
-        current_version = await self._get_latest_version(vps_id)
-        new_version = (current_version or 0) + 1
+        # Identical resubmission of the latest live version: nothing to decrypt, diff
+        # or store. A failed or rolled back version gets a new version instead.
+        content_hash = hash_config_content(content)
+        if (
+            previous_config
+            and previous_config.status in _LIVE_CONFIG_STATUSES
+            and previous_config.content_hash == content_hash
+            and previous_config.config_name == config_name
+        ):
+            return previous_config, False
+        
+        new_version = previous_config.version + 1 if previous_config else 1
+        
+        # Diffing and encryption are CPU-bound, run them off the event loop
+        loop = asyncio.get_event_loop()
+        encrypt_future = loop.run_in_executor(None, encrypt_data, content)
         
         # Generate diff if there's a previous version
-        diff_json = None
-        if current_version:
-            previous_config = await self._get_config_by_version(vps_id, current_version)
-            if previous_config:
-                previous_content = decrypt_data(previous_config.content_encrypted)
-                diff_json = self._generate_diff(previous_content, content)
+        diff_json = diff_blob = None
+        if previous_config:
+            previous_content = await self._get_plaintext(previous_config)
+            diff_json, diff_blob = await loop.run_in_executor(
+                None, self._generate_diff, previous_content, content
+            )
         
         # Encrypt content
-        content_encrypted = encrypt_data(content)
+        content_encrypted = await encrypt_future
         
         # Create new config record
         config = NginxConfig(
@@ -54,8 +197,10 @@ class NginxConfigService:
             version=new_version,
             author_id=author_id,
             content_encrypted=content_encrypted,
+            content_hash=content_hash,
             summary=summary,
             diff_json=diff_json,
+            diff_blob=diff_blob,
             config_name=config_name,
             config_type=config_type,
             template_used=template_used
@@ -65,16 +210,20 @@ class NginxConfigService:
         await self.db.commit()
         await self.db.refresh(config)
         
-        return config
+        # The next version will diff against this one, so keep its plaintext around
+        _cache_plaintext(str(config.id), content_encrypted, content)
+        
+        return config, True
     
     async def validate_config(
         self,
         vps_id: str,
         content: str,
-        dry_run: bool = True
+        dry_run: bool = True,
+        fail_fast: bool = False
     ) -> ValidationResult:
         """Validate configuration with comprehensive checks"""
-        return await self.validator.validate_config(content, vps_id, dry_run)
+        return await self.validator.validate_config(content, vps_id, dry_run, fail_fast)
     
     async def apply_config(
         self,
@@ -87,6 +236,8 @@ class NginxConfigService:
         """Apply configuration with safety checks and automatic rollback"""
         
         task_id = generate_secure_token(8)
+        started_at = datetime.now(timezone.utc)
+        audit_entry = None
         
         try:
             # Get config
@@ -95,30 +246,32 @@ class NginxConfigService:
                 raise ValueError("Configuration not found")
             
             # Decrypt content
-            content = decrypt_data(config.content_encrypted)
-            
-            # Log start of operation
-            if self.audit_service:
-                await self.audit_service.log_action(
-                    task_id=task_id,
-                    action="nginx_config_apply",
-                    resource_type="nginx_config",
-                    resource_id=config.id,
-                    actor_id=author_id,
-                    description=f"Applying nginx config version {config.version}",
-                    details={
-                        "vps_id": str(config.vps_id),
-                        "config_name": config.config_name,
-                        "dry_run": dry_run,
-                        "scheduled_at": scheduled_at.isoformat() if scheduled_at else None,
-                        "watch_window_seconds": watch_window_seconds
-                    }
-                )
+            content = await self._get_plaintext(config)
+            
+            # Audit entry for the operation; finished operations are logged in one write
+            audit_entry = {
+                "action": "nginx_config_apply",
+                "resource_type": "nginx_config",
+                "resource_id": config.id,
+                "actor_id": author_id,
+                "description": f"Applying nginx config version {config.version}",
+                "details": {
+                    "vps_id": str(config.vps_id),
+                    "config_name": config.config_name,
+                    "dry_run": dry_run,
+                    "scheduled_at": scheduled_at.isoformat() if scheduled_at else None,
+                    "watch_window_seconds": watch_window_seconds
+                }
+            }
             
             # Schedule for later if requested
             if scheduled_at and scheduled_at > datetime.utcnow():
                 config.scheduled_apply_at = scheduled_at
                 await self.db.commit()
+                
+                # Keep the pending entry visible until the scheduled apply runs
+                if self.audit_service:
+                    await self.audit_service.log_action(task_id=task_id, **audit_entry)
                 return {
                     "success": True,
                     "task_id": task_id,
@@ -126,24 +279,36 @@ class NginxConfigService:
                     "scheduled": True
                 }
             
-            # Validate before apply
-            validation = await self.validate_config(str(config.vps_id), content, dry_run=False)
-            config.nginx_test_result = {
-                "is_valid": validation.is_valid,
-                "errors": validation.errors,
-                "warnings": validation.warnings,
-                "output": validation.nginx_test_output
-            }
+            # Validate before apply, unless this exact content passed full validation
+            # recently (the draft is still tested with nginx -t while applying)
+            content_hash = hash_config_content(content)
+            if self._is_recently_validated(config, content_hash):
+                validation = ValidationResult(
+                    is_valid=True,
+                    errors=[],
+                    warnings=(config.nginx_test_result or {}).get("warnings", []),
+                    task_id=task_id
+                )
+            else:
+                validation = await self.validate_config(str(config.vps_id), content, dry_run=False)
+                config.nginx_test_result = {
+                    "is_valid": validation.is_valid,
+                    "errors": validation.errors,
+                    "warnings": validation.warnings,
+                    "output": validation.nginx_test_output
+                }
+                if validation.is_valid:
+                    config.validated_at = datetime.now(timezone.utc)
+                    config.validated_hash = content_hash
             
             if not validation.is_valid:
                 config.status = "failed"
                 await self.db.commit()
                 
                 error_message = "; ".join(validation.errors)
-                if self.audit_service:
-                    await self.audit_service.complete_action(
-                        task_id, "failed", error_message=error_message
-                    )
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "failed", error_message=error_message
+                )
                 
                 return {
                     "success": False,
@@ -154,6 +319,9 @@ class NginxConfigService:
             
             # If dry run, stop here
             if dry_run:
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "success", result={"dry_run": True}
+                )
                 return {
                     "success": True,
                     "task_id": task_id,
@@ -169,19 +337,23 @@ class NginxConfigService:
                 config.status = "applied"
                 config.applied_at = datetime.utcnow()
                 config.watch_window_seconds = watch_window_seconds
+                if watch_window_seconds <= 0:
+                    # No health monitoring, so the config counts as good right away
+                    await self._set_last_successful_config(config.vps_id, config.id)
                 await self.db.commit()
                 
-                # Start health monitoring if watch window > 0
+                # Start health monitoring if watch window > 0. The check runs in a
+                # worker once the window has passed, with its own database session
                 if watch_window_seconds > 0:
-                    asyncio.create_task(
-                        self._monitor_health_and_rollback(config.id, watch_window_seconds, task_id)
+                    from app.tasks.nginx_tasks import monitor_nginx_health_task
+                    monitor_nginx_health_task.apply_async(
+                        args=[str(config.id), task_id], countdown=watch_window_seconds
                     )
                 
-                if self.audit_service:
-                    await self.audit_service.complete_action(
-                        task_id, "success", 
-                        result={"applied_at": config.applied_at.isoformat()}
-                    )
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "success",
+                    result={"applied_at": config.applied_at.isoformat()}
+                )
                 
                 return {
                     "success": True,
@@ -194,10 +366,10 @@ class NginxConfigService:
                 config.status = "failed"
                 await self.db.commit()
                 
-                if self.audit_service:
-                    await self.audit_service.complete_action(
-                        task_id, "failed", error_message=apply_result.get("error", "Unknown error")
-                    )
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "failed",
+                    error_message=apply_result.get("error", "Unknown error")
+                )
                 
                 return {
                     "success": False,
@@ -208,10 +380,9 @@ class NginxConfigService:
         except Exception as e:
             sanitized_error = sanitize_error_message(str(e), task_id)
             
-            if self.audit_service:
-                await self.audit_service.complete_action(
-                    task_id, "failed", error_message=sanitized_error["error"]
-                )
+            await self._log_completed_action(
+                task_id, started_at, audit_entry, "failed", error_message=sanitized_error["error"]
+            )
             
             return {
                 "success": False,
@@ -228,81 +399,44 @@ class NginxConfigService:
         """Rollback to previous or specified version"""
         
         task_id = generate_secure_token(8)
+        started_at = datetime.now(timezone.utc)
+        audit_entry = None
         
         try:
-            if target_version is None:
-                # Find last successful version
-                target_config = await self._get_last_successful_config(vps_id)
-            else:
-                target_config = await self._get_config_by_version(vps_id, target_version)
-            
-            if not target_config:
-                return {
-                    "success": False,
-                    "task_id": task_id,
-                    "error": "No suitable version found for rollback"
+            result = await self._rollback_config_no_commit(vps_id, target_version, task_id)
+            target_config = result.pop("target_config", None)
+            
+            if target_config:
+                # Audit entry for the rollback, written once it has finished
+                audit_entry = {
+                    "action": "nginx_config_rollback",
+                    "resource_type": "nginx_config",
+                    "resource_id": target_config.id,
+                    "actor_id": author_id,
+                    "description": f"Rolling back to nginx config version {target_config.version}",
+                    "details": {"vps_id": str(vps_id), "target_version": target_config.version}
                 }
             
-            # Log rollback start
-            if self.audit_service:
-                await self.audit_service.log_action(
-                    task_id=task_id,
-                    action="nginx_config_rollback",
-                    resource_type="nginx_config",
-                    resource_id=target_config.id,
-                    actor_id=author_id,
-                    description=f"Rolling back to nginx config version {target_config.version}",
-                    details={"vps_id": str(vps_id), "target_version": target_config.version}
-                )
-            
-            # Decrypt and apply target configuration
-            content = decrypt_data(target_config.content_encrypted)
-            apply_result = await self._apply_config_to_vps(target_config, content, task_id)
-            
-            if apply_result["success"]:
-                # Mark current configs as rolled back
-                current_configs = await self._get_current_configs(vps_id)
-                for config in current_configs:
-                    if config.id != target_config.id:
-                        config.status = "rolled_back"
-                        config.rollback_triggered = True
-                
-                # Update target config status
-                target_config.status = "applied"
-                target_config.applied_at = datetime.utcnow()
+            if result["success"]:
                 await self.db.commit()
                 
-                if self.audit_service:
-                    await self.audit_service.complete_action(
-                        task_id, "success",
-                        result={"rolled_back_to_version": target_config.version}
-                    )
-                
-                return {
-                    "success": True,
-                    "task_id": task_id,
-                    "message": f"Successfully rolled back to version {target_config.version}",
-                    "version": target_config.version
-                }
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "success",
+                    result={"rolled_back_to_version": target_config.version}
+                )
             else:
-                if self.audit_service:
-                    await self.audit_service.complete_action(
-                        task_id, "failed", error_message=apply_result.get("error", "Rollback failed")
-                    )
-                
-                return {
-                    "success": False,
-                    "task_id": task_id,
-                    "error": apply_result.get("error", "Rollback failed")
-                }
+                await self._log_completed_action(
+                    task_id, started_at, audit_entry, "failed", error_message=result["error"]
+                )
+            
+            return result
                 
         except Exception as e:
             sanitized_error = sanitize_error_message(str(e), task_id)
             
-            if self.audit_service:
-                await self.audit_service.complete_action(
-                    task_id, "failed", error_message=sanitized_error["error"]
-                )
+            await self._log_completed_action(
+                task_id, started_at, audit_entry, "failed", error_message=sanitized_error["error"]
+            )
             
             return {
                 "success": False,
@@ -310,31 +444,102 @@ class NginxConfigService:
                 "error": sanitized_error["error"]
             }
     
+    async def _rollback_config_no_commit(
+        self,
+        vps_id: str,
+        target_version: Optional[int],
+        task_id: str
+    ) -> Dict[str, Any]:
+        """Apply the rollback target and stage the status changes without committing.
+        
+        The result includes the target config (when one was found) under "target_config".
+        """
+        if target_version is None:
+            # Find last successful version
+            target_config = await self._get_last_successful_config(vps_id)
+        else:
+            target_config = await self._get_config_by_version(vps_id, target_version)
+        
+        if not target_config:
+            return {
+                "success": False,
+                "task_id": task_id,
+                "error": "No suitable version found for rollback"
+            }
+        
+        # Decrypt and apply target configuration
+        content = await self._get_plaintext(target_config)
+        apply_result = await self._apply_config_to_vps(target_config, content, task_id)
+        
+        if not apply_result["success"]:
+            return {
+                "success": False,
+                "task_id": task_id,
+                "error": apply_result.get("error", "Rollback failed"),
+                "target_config": target_config
+            }
+        
+        # Mark current configs as rolled back in a single statement
+        await self.db.execute(
+            update(NginxConfig)
+            .where(and_(
+                NginxConfig.vps_id == vps_id,
+                NginxConfig.status == "applied",
+                NginxConfig.id != target_config.id
+            ))
+            .values(status="rolled_back", rollback_triggered=True)
+            .execution_options(synchronize_session=False)
+        )
+        
+        # Update target config status
+        target_config.status = "applied"
+        target_config.applied_at = datetime.utcnow()
+        await self._set_last_successful_config(target_config.vps_id, target_config.id)
+        
+        return {
+            "success": True,
+            "task_id": task_id,
+            "message": f"Successfully rolled back to version {target_config.version}",
+            "version": target_config.version,
+            "target_config": target_config
+        }
+    
     async def get_config_versions(self, vps_id: str) -> List[Dict[str, Any]]:
         """Get all configuration versions for a VPS"""
+        # Only metadata columns are needed; skip the encrypted content and diff
         query = (
-            select(NginxConfig)
+            select(
+                NginxConfig.id,
+                NginxConfig.version,
+                NginxConfig.author_id,
+                NginxConfig.summary,
+                NginxConfig.status,
+                NginxConfig.config_name,
+                NginxConfig.config_type,
+                NginxConfig.applied_at,
+                NginxConfig.created_at,
+                NginxConfig.rollback_triggered
+            )
             .where(NginxConfig.vps_id == vps_id)
             .order_by(desc(NginxConfig.version))
         )
         result = await self.db.execute(query)
-        configs = result.scalars().all()
         
         return [
             {
-                "id": str(config.id),
-                "version": config.version,
-                "author_id": str(config.author_id),
-                "summary": config.summary,
-                "status": config.status,
-                "config_name": config.config_name,
-                "config_type": config.config_type,
-                "applied_at": config.applied_at.isoformat() if config.applied_at else None,
-                "created_at": config.created_at.isoformat(),
-                "is_active": config.is_active,
-                "rollback_triggered": config.rollback_triggered
+                "id": str(row.id),
+                "version": row.version,
+                "author_id": str(row.author_id),
+                "summary": row.summary,
+                "status": row.status,
+                "config_name": row.config_name,
+                "config_type": row.config_type,
+                "applied_at": row.applied_at.isoformat() if row.applied_at else None,
+                "created_at": row.created_at.isoformat(),
+                "is_active": row.status == "applied" and not row.rollback_triggered,
+                "rollback_triggered": row.rollback_triggered
             }
-            for config in configs
+            for row in result.all()
         ]
     
     async def get_config_content(self, config_id: str, mask_sensitive: bool = True) -> Optional[str]:
@@ -343,83 +548,148 @@ class NginxConfigService:
         if not config:
             return None
         
-        content = decrypt_data(config.content_encrypted)
+        content = await self._get_plaintext(config)
         
         if mask_sensitive:
             # Mask sensitive information like passwords
-            content = self._mask_sensitive_content(content)
+            content = await asyncio.get_event_loop().run_in_executor(
+                None, self._mask_sensitive_content, content
+            )
         
         return content
     
     # Private helper methods
     
-    async def _get_latest_version(self, vps_id: str) -> Optional[int]:
-        """Get the latest version number for a VPS"""
-        query = (
-            select(NginxConfig.version)
-            .where(NginxConfig.vps_id == vps_id)
-            .order_by(desc(NginxConfig.version))
-            .limit(1)
+    def _is_recently_validated(self, config: NginxConfig, content_hash: str) -> bool:
+        """Check whether the config content passed full validation within the reuse window"""
+        if not config.validated_at or config.validated_hash != content_hash:
+            return False
+        age = datetime.now(timezone.utc) - config.validated_at
+        return age < timedelta(seconds=VALIDATION_REUSE_SECONDS)
+    
+    async def _log_completed_action(
+        self,
+        task_id: str,
+        started_at: datetime,
+        audit_entry: Optional[Dict[str, Any]],
+        status: str,
+        **kwargs
+    ):
+        """Write the audit entry for a finished operation in a single insert"""
+        if self.audit_service and audit_entry:
+            await self.audit_service.log_complete(
+                task_id=task_id, started_at=started_at, status=status, **audit_entry, **kwargs
+            )
+    
+    async def _get_plaintext(self, config: NginxConfig) -> str:
+        """Get decrypted config content, reusing a cached copy when the ciphertext is unchanged"""
+        config_id = str(config.id)
+        cached = _plaintext_cache.get(config_id)
+        if cached and cached[0] == config.content_encrypted:
+            _plaintext_cache.move_to_end(config_id)
+            return cached[1]
+        
+        plaintext = await asyncio.get_event_loop().run_in_executor(
+            None, decrypt_data, config.content_encrypted
         )
-        result = await self.db.execute(query)
-        return result.scalar()
+        _cache_plaintext(config_id, config.content_encrypted, plaintext)
+        return plaintext
+    
+    async def _get_latest_config(self, vps_id: str) -> Optional[NginxConfig]:
+        """Get the latest config version for a VPS"""
+        result = await self.db.execute(_LATEST_CONFIG_QUERY, {"vps_id": vps_id})
+        return result.scalar_one_or_none()
+    
+    async def get_config_diff(self, config_id: str, mask_sensitive: bool = True) -> List[str]:
+        """Get the unified diff lines of a config version against its predecessor"""
+        result = await self.db.execute(_CONFIG_DIFF_QUERY, {"config_id": config_id})
+        diff_blob = result.scalar_one_or_none()
+        if not diff_blob:
+            return []
+        diff = zlib.decompress(diff_blob).decode('utf-8')
+        
+        if mask_sensitive:
+            # The diff carries config lines, so mask them like the content itself
+            diff = self._mask_sensitive_content(diff)
+        
+        return diff.splitlines(keepends=True)
     
     async def _get_config_by_id(self, config_id: str) -> Optional[NginxConfig]:
         """Get config by ID"""
-        query = select(NginxConfig).where(NginxConfig.id == config_id)
-        result = await self.db.execute(query)
+        result = await self.db.execute(_CONFIG_BY_ID_QUERY, {"config_id": config_id})
         return result.scalar_one_or_none()
     
     async def _get_config_by_version(self, vps_id: str, version: int) -> Optional[NginxConfig]:
         """Get config by VPS and version"""
-        query = (
-            select(NginxConfig)
-            .where(and_(NginxConfig.vps_id == vps_id, NginxConfig.version == version))
-        )
-        result = await self.db.execute(query)
+        result = await self.db.execute(_CONFIG_BY_VERSION_QUERY, {"vps_id": vps_id, "version": version})
         return result.scalar_one_or_none()
     
     async def _get_last_successful_config(self, vps_id: str) -> Optional[NginxConfig]:
         """Get the last successfully applied config"""
-        query = (
-            select(NginxConfig)
-            .where(and_(
-                NginxConfig.vps_id == vps_id,
-                NginxConfig.status == "applied",
-                NginxConfig.rollback_triggered == False
-            ))
-            .order_by(desc(NginxConfig.applied_at))
-            .limit(1)
-        )
-        result = await self.db.execute(query)
+        # Prefer the pointer kept on the VPS, fall back to searching its configs
+        result = await self.db.execute(_KNOWN_GOOD_CONFIG_QUERY, {"vps_id": vps_id})
+        config = result.scalar_one_or_none()
+        if config:
+            return config
+        
+        result = await self.db.execute(_LAST_SUCCESSFUL_CONFIG_QUERY, {"vps_id": vps_id})
         return result.scalar_one_or_none()
     
-    async def _get_current_configs(self, vps_id: str) -> List[NginxConfig]:
-        """Get currently applied configs"""
-        query = (
-            select(NginxConfig)
-            .where(and_(
-                NginxConfig.vps_id == vps_id,
-                NginxConfig.status == "applied"
-            ))
+    async def _get_host_info(self, vps_id) -> Optional[Dict[str, Any]]:
+        """Get the SSH connection info of a VPS, so calls work without a pooled
+        connection (e.g. from a worker process)"""
+        vps = await self.db.get(VPSHost, vps_id)
+        if not vps:
+            return None
+        return {
+            "ip_address": vps.ip_address,
+            "port": vps.port,
+            "username": vps.username,
+            "password_encrypted": vps.password_encrypted,
+            "private_key_encrypted": vps.private_key_encrypted
+        }
+    
+    async def _set_last_successful_config(self, vps_id: str, config_id: str):
+        """Point the VPS at its last known-good config, staged with the caller's changes"""
+        await self.db.execute(
+            update(VPSHost)
+            .where(VPSHost.id == vps_id)
+            .values(last_successful_config_id=config_id)
+            .execution_options(synchronize_session=False)
         )
-        result = await self.db.execute(query)
-        return result.scalars().all()
     
-    def _generate_diff(self, old_content: str, new_content: str) -> Dict[str, Any]:
-        """Generate diff between two configurations"""
-        diff = list(difflib.unified_diff(
+    def _generate_diff(self, old_content: str, new_content: str) -> Tuple[Dict[str, Any], bytes]:
+        """Generate diff between two configurations.
+        
+        Returns the line counts stored in diff_json and the compressed diff text.
+        """
+        diff = []
+        append = diff.append
+        added = removed = 0
+        
+        # Tally added/removed lines while collecting the diff, in a single pass
+        for line in _unified_diff(
             old_content.splitlines(keepends=True),
             new_content.splitlines(keepends=True),
             fromfile="previous",
             tofile="current"
-        ))
+        ):
+            # The last line of a file may lack a newline; keep one diff line per line
+            if line[-1:] != '\n':
+                line += '\n'
+            append(line)
+            if line[:1] == '+':
+                if line[:3] != '+++':
+                    added += 1
+            elif line[:1] == '-':
+                if line[:3] != '---':
+                    removed += 1
         
-        return {
-            "diff_lines": diff,
-            "added_lines": len([line for line in diff if line.startswith('+') and not line.startswith('+++')]),
-            "removed_lines": len([line for line in diff if line.startswith('-') and not line.startswith('---')])
+        diff_json = {
+            "added_lines": added,
+            "removed_lines": removed
         }
+        return diff_json, zlib.compress(''.join(diff).encode('utf-8'), DIFF_COMPRESSION_LEVEL)
     
     async def _apply_config_to_vps(self, config: NginxConfig, content: str, task_id: str) -> Dict[str, Any]:
         """Apply configuration to VPS via SSH"""
@@ -428,39 +698,38 @@ class NginxConfigService:
         
         try:
             vps_id = str(config.vps_id)
+            host_info = await self._get_host_info(config.vps_id)
+            if not host_info:
+                return {"success": False, "error": "VPS not found"}
             
             # Create backup of current config
-            backup_result = await self.ssh_service.backup_nginx_config(vps_id, task_id)
+            backup_result = await self.ssh_service.backup_nginx_config(vps_id, task_id, host_info=host_info)
             if not backup_result["success"]:
                 return {"success": False, "error": f"Failed to backup current config: {backup_result['error']}"}
             
-            # Write new config to drafts directory
-            drafts_path = f"/etc/nginx/managed.d/drafts/{config.config_name}_{config.version}.conf"
-            write_result = await self.ssh_service.write_file(vps_id, drafts_path, content)
+            # Write new config straight to its active path; write_file uploads to
+            # a temporary file and renames it into place over SFTP
+            active_path = f"/etc/nginx/managed.d/{config.config_name}_{config.version}.conf"
+            write_result = await self.ssh_service.write_file(vps_id, active_path, content, host_info=host_info)
             if not write_result["success"]:
                 return {"success": False, "error": f"Failed to write config file: {write_result['error']}"}
             
-            # Test configuration
-            test_result = await self.ssh_service.execute_command(vps_id, "nginx -t")
-            if test_result["exit_code"] != 0:
-                # Clean up draft file
-                await self.ssh_service.execute_command(vps_id, f"rm -f {drafts_path}")
-                return {"success": False, "error": f"nginx -t failed: {test_result['stderr']}"}
-            
-            # Move to active directory and create symlink
-            active_path = f"/etc/nginx/managed.d/{config.config_name}_{config.version}.conf"
+            # Test configuration, create symlink and reload nginx in a single
+            # remote shell invocation
             enabled_path = f"/etc/nginx/sites-enabled/{config.config_name}.conf"
+            active, enabled = (shlex.quote(p) for p in (active_path, enabled_path))
             
-            commands = [
-                f"mv {drafts_path} {active_path}",
-                f"ln -sf {active_path} {enabled_path}",
-                "systemctl reload nginx"
-            ]
+            script = (
+                # Remove the new file again if the test fails
+                f"if ! nginx -t; then rm -f {active}; exit {NGINX_TEST_FAILED_EXIT_CODE}; fi; "
+                f"set -e; ln -sf {active} {enabled}; systemctl reload nginx"
+            )
+            result = await self.ssh_service.execute_command(vps_id, script, host_info=host_info)
             
-            for cmd in commands:
-                result = await self.ssh_service.execute_command(vps_id, cmd)
-                if result["exit_code"] != 0:
-                    return {"success": False, "error": f"Command failed '{cmd}': {result['stderr']}"}
+            if result["exit_code"] == NGINX_TEST_FAILED_EXIT_CODE:
+                return {"success": False, "error": f"nginx -t failed: {result['stderr']}"}
+            if result["exit_code"] != 0:
+                return {"success": False, "error": f"Failed to activate configuration: {result['stderr']}"}
             
             return {"success": True, "message": "Configuration applied successfully"}
             
@@ -468,10 +737,8 @@ class NginxConfigService:
             sanitized_error = sanitize_error_message(str(e), task_id)
             return {"success": False, "error": sanitized_error["error"]}
     
-    async def _monitor_health_and_rollback(self, config_id: str, watch_window_seconds: int, task_id: str):
-        """Monitor health and trigger automatic rollback if needed"""
-        await asyncio.sleep(watch_window_seconds)
-        
+    async def monitor_health_and_rollback(self, config_id: str, task_id: str):
+        """Check health after the watch window and trigger automatic rollback if needed"""
         try:
             config = await self._get_config_by_id(config_id)
             if not config or config.status != "applied":
@@ -483,21 +750,26 @@ class NginxConfigService:
             config.health_check_passed = health_result["healthy"]
             config.health_check_details = health_result["details"]
             
-            if not health_result["healthy"]:
+            if health_result["healthy"]:
+                await self._set_last_successful_config(config.vps_id, config.id)
+            else:
                 # Trigger automatic rollback
                 config.rollback_triggered = True
                 config.rollback_reason = f"Automatic rollback due to health check failure: {health_result['reason']}"
                 config.status = "rolled_back"
                 
-                # Perform rollback
-                rollback_result = await self.rollback_config(
-                    str(config.vps_id), 
-                    author_id=None  # System rollback
+                # Perform rollback; its status changes are committed below together
+                # with the health check results and the audit entry
+                started_at = datetime.now(timezone.utc)
+                rollback_task_id = f"{task_id}_auto_rollback"
+                rollback_result = await self._rollback_config_no_commit(
+                    str(config.vps_id), None, rollback_task_id
                 )
+                rollback_result.pop("target_config", None)
                 
                 if self.audit_service:
-                    await self.audit_service.log_action(
-                        task_id=f"{task_id}_auto_rollback",
+                    await self.audit_service.log_complete(
+                        task_id=rollback_task_id,
                         action="nginx_config_auto_rollback",
                         resource_type="nginx_config",
                         resource_id=config.id,
@@ -508,7 +780,10 @@ class NginxConfigService:
                             "health_check_result": health_result,
                             "rollback_result": rollback_result
                         },
-                        status="success" if rollback_result["success"] else "failed"
+                        status="success" if rollback_result["success"] else "failed",
+                        started_at=started_at,
+                        error_message=rollback_result.get("error"),
+                        commit=False
                     )
             
             await self.db.commit()
@@ -535,9 +810,21 @@ class NginxConfigService:
         
         try:
             vps_id = str(config.vps_id)
+            host_info = await self._get_host_info(config.vps_id)
+            if not host_info:
+                return {"healthy": False, "reason": "VPS not found", "details": {}}
+            
+            # Check nginx status and recent nginx errors concurrently
+            # (journald filters errors on its indexed priority field)
+            nginx_status, error_check = await asyncio.gather(
+                self.ssh_service.execute_command(vps_id, "systemctl is-active nginx", host_info=host_info),
+                self.ssh_service.execute_command(
+                    vps_id, 
+                    "journalctl -u nginx --since='2 minutes ago' -p err -o cat -q --no-pager | wc -l",
+                    host_info=host_info
+                )
+            )
             
-            # Check nginx status
-            nginx_status = await self.ssh_service.execute_command(vps_id, "systemctl is-active nginx")
             if nginx_status["stdout"].strip() != "active":
                 return {
                     "healthy": False,
@@ -545,12 +832,6 @@ class NginxConfigService:
                     "details": {"nginx_status": nginx_status["stdout"].strip()}
                 }
             
-            # Check for recent nginx errors
-            error_check = await self.ssh_service.execute_command(
-                vps_id, 
-                "journalctl -u nginx --since='2 minutes ago' | grep -i error | wc -l"
-            )
-            
             error_count = int(error_check["stdout"].strip() or "0")
             if error_count > 10:  # Threshold for error spike
                 return {
@@ -574,22 +855,10 @@ class NginxConfigService:
     
     def _mask_sensitive_content(self, content: str) -> str:
         """Mask sensitive information in configuration content"""
-        import re
-        
-        # Mask basic auth credentials
-        content = re.sub(
-            r'(auth_basic_user_file\s+[^;]+;.*?)([^\n]+)',
-            r'\1[MASKED_AUTH_FILE]',
-            content,
-            flags=re.IGNORECASE | re.DOTALL
-        )
+        # Mask basic auth credentials file
+        content = _AUTH_FILE_RE.sub(r'\1[MASKED_AUTH_FILE]', content)
         
         # Mask SSL certificate content
-        content = re.sub(
-            r'(-----BEGIN [^-]+-----)(.*?)(-----END [^-]+-----)',
-            r'\1[MASKED_CERTIFICATE]\3',
-            content,
-            flags=re.DOTALL
-        )
+        content = _CERTIFICATE_RE.sub(r'\1[MASKED_CERTIFICATE]\3', content)
         
-        return content
\ No newline at end of file
+        return content
@@ -1,10 +1,114 @@
 import re
+import shlex
+import asyncio
 import tempfile
 import os
-from typing import Dict, List, Optional, Tuple
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 from app.core.security import sanitize_error_message
 
+try:
+    # Linear-time regex engine for scanning untrusted config content, if installed
+    import re2 as _linear_re
+except ImportError:
+    _linear_re = re
+
+
+# Absolute path of the nginx binary on each VPS, discovered on its first remote test
+_nginx_paths: Dict[str, str] = {}
+
+# Shell exit status for a command that could not be found
+NGINX_NOT_FOUND_EXIT_CODE = 127
+
+# Largest client_max_body_size accepted in a server block (100MB)
+MAX_CLIENT_BODY_SIZE_BYTES = 100 * 1024 * 1024
+
+_SIZE_SUFFIX_BYTES = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+
+
+@lru_cache(maxsize=256)
+def _size_in_bytes(size_str: str) -> int:
+    """Convert an nginx size such as '512', '64k', '10m' or '1g' to bytes"""
+    multiplier = _SIZE_SUFFIX_BYTES.get(size_str[-1:].lower())
+    if multiplier is None:
+        return int(size_str)
+    return int(size_str[:-1]) * multiplier
+
+
+@lru_cache(maxsize=None)
+def _build_static_scanner(forbidden: tuple, dangerous: tuple, headers: tuple) -> re.Pattern:
+    """Fuse every static pattern check into one lookahead alternation.
+    
+    A single pass over the config then finds them all. Group names identify the
+    check and the position in its list; the lookahead lets overlapping hits all be
+    reported. Patterns are lowercased to run against lowercased content, so no case
+    folding happens during the scan. Compiled once per distinct set of lists.
+    """
+    return re.compile(
+        "(?=" + "|".join([
+            *(f"(?P<f{i}>{re.escape(d.lower())})" for i, d in enumerate(forbidden)),
+            *(f"(?P<d{i}>{p.lower()})" for i, p in enumerate(dangerous)),
+            *(f"(?P<h{i}>{re.escape(h.lower())})" for i, h in enumerate(headers)),
+            r"(?P<body_size>client_max_body_size\s)",
+            r"(?P<read_timeout>proxy_read_timeout\s)",
+        ]) + ")"
+    )
+
+
+@lru_cache(maxsize=None)
+def _build_deal_breaker_scanner(forbidden: tuple, dangerous: tuple):
+    """Forbidden directives and dangerous includes alone, for fail-fast validation.
+    
+    Compiled with re2 when available, so no include pattern can backtrack badly.
+    """
+    return _linear_re.compile(
+        "|".join([
+            *(f"(?P<f{i}>{re.escape(d.lower())})" for i, d in enumerate(forbidden)),
+            *(f"(?P<d{i}>{p.lower()})" for i, p in enumerate(dangerous)),
+        ])
+    )
+
+
+# Static validation results by validator class and content digest:
+# {(class, digest): (errors, warnings)}.
+# The checks depend only on the content, so identical configs are checked once.
+STATIC_RESULT_CACHE_MAX_SIZE = 256
+_static_result_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def clear_static_validation_cache() -> None:
+    """Drop all memoized static validation results"""
+    _static_result_cache.clear()
+
+
+# Tokens that affect brace balancing: an escape with the character it escapes,
+# a quote, or a brace
+_BRACE_TOKEN_RE = re.compile(r'\\.?|["\'{}]', re.DOTALL)
+
+# Everything but braces, and the depth change for each brace
+_NON_BRACE_RE = re.compile(r'[^{}]+')
+_BRACE_DEPTH_STEP = {'{': 1, '}': -1}
+
+# Tokens for locating server blocks: a quoted string or a comment (both skipped),
+# a "server {" opener at the start of a directive, or any other brace
+_SERVER_BLOCK_TOKEN_RE = re.compile(
+    r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\''
+    r'|(?:^|(?<=[\s;{}]))#[^\n]*'
+    r'|(?:^|(?<=[;{}]))\s*(?P<opener>server)\s*\{'
+    r'|[{}]',
+    re.MULTILINE
+)
+
+# Directives checked inside each server block (matched against lowercased content)
+_SERVER_DIRECTIVE_RE = _linear_re.compile(
+    r'(?P<directive>\b(?:listen|server_name|proxy_pass)\b)'
+    r'|(?P<host_header>\bproxy_set_header\s+host\b)'
+    r'|(?P<body_size>client_max_body_size\s+(?P<size>\d+[kmg]?);)'
+)
 
 @dataclass
 class ValidationResult:
@@ -20,29 +124,29 @@ class NginxConfigValidator:
     """Comprehensive Nginx configuration validator with safety checks"""
     
     # Forbidden directives for security
-    FORBIDDEN_DIRECTIVES = [
+    FORBIDDEN_DIRECTIVES = (
         "exec",
         "lua_code_cache off",
         "perl_modules",
         "perl_require"
-    ]
+    )
     
     # Dangerous include patterns
-    DANGEROUS_INCLUDE_PATTERNS = [
+    DANGEROUS_INCLUDE_PATTERNS = (
         r"/etc/passwd",
         r"/etc/shadow",
         r"/root/",
         r"/home/[^/]*/\.",
         r"/var/log/",
         r"/proc/"
-    ]
+    )
     
     # Required security headers
-    RECOMMENDED_SECURITY_HEADERS = [
+    RECOMMENDED_SECURITY_HEADERS = (
         "X-Content-Type-Options",
         "X-Frame-Options",
         "X-XSS-Protection"
-    ]
+    )
     
     def __init__(self, ssh_service=None):
         self.ssh_service = ssh_service
@@ -51,7 +155,8 @@ class NginxConfigValidator:
         self, 
         config_content: str, 
         vps_id: str, 
-        dry_run: bool = True
+        dry_run: bool = True,
+        fail_fast: bool = False
     ) -> ValidationResult:
         """
         Comprehensive validation of nginx configuration
@@ -60,6 +165,8 @@ class NginxConfigValidator:
             config_content: The nginx configuration to validate
             vps_id: ID of the VPS where config will be applied
             dry_run: Whether to only validate without applying
+            fail_fast: Stop at the first forbidden directive or dangerous include,
+                reporting only that error
             
         Returns:
             ValidationResult with validation details
@@ -70,16 +177,47 @@ class NginxConfigValidator:
         errors = []
         warnings = []
         
-        # 1. Static validation (syntax, security, policy)
-        static_result = self._static_validation(config_content)
+        # Forbidden directives and dangerous includes can't be outweighed by anything
+        # else, so a caller that only needs the verdict can stop at the first one
+        if fail_fast:
+            deal_breaker = self._find_deal_breaker(config_content)
+            if deal_breaker:
+                return ValidationResult(
+                    is_valid=False,
+                    errors=[deal_breaker],
+                    warnings=warnings,
+                    task_id=task_id
+                )
+        
+        # Start the remote nginx -t first (if not dry_run) so its round-trip overlaps
+        # the static checks below
+        remote_test = None
+        if not dry_run and self.ssh_service:
+            remote_test = asyncio.ensure_future(
+                self._remote_nginx_test(config_content, vps_id, task_id)
+            )
+        
+        try:
+            if remote_test is not None:
+                # Let the task run up to its first SSH call before checking statically
+                await asyncio.sleep(0)
+            
+            # 1. Static validation (syntax, security, policy)
+            static_result = self._static_validation(config_content)
+        except BaseException:
+            # Don't leave the remote test running unobserved if we won't collect it
+            if remote_test is not None:
+                remote_test.cancel()
+                await asyncio.gather(remote_test, return_exceptions=True)
+            raise
         errors.extend(static_result['errors'])
         warnings.extend(static_result['warnings'])
         
-        # 2. Remote nginx -t validation if not dry_run
+        # 2. Remote nginx -t validation result
         nginx_test_output = None
-        if not dry_run and self.ssh_service:
+        if remote_test is not None:
             try:
-                nginx_result = await self._remote_nginx_test(config_content, vps_id, task_id)
+                nginx_result = await remote_test
                 nginx_test_output = nginx_result['output']
                 if not nginx_result['success']:
                     errors.extend(nginx_result['errors'])
@@ -97,40 +235,74 @@ class NginxConfigValidator:
         )
     
     def _static_validation(self, config_content: str) -> Dict[str, List[str]]:
-        """Perform static validation checks"""
+        """Perform static validation checks, reusing the result for repeated content"""
+        # Keyed by validator class too, since subclasses may override the pattern lists
+        digest = hashlib.blake2b(config_content.encode('utf-8'), digest_size=16).digest()
+        key = (type(self), digest)
+        cached = _static_result_cache.get(key)
+        if cached is None:
+            result = self._run_static_checks(config_content)
+            cached = (tuple(result["errors"]), tuple(result["warnings"]))
+            _static_result_cache[key] = cached
+            while len(_static_result_cache) > STATIC_RESULT_CACHE_MAX_SIZE:
+                _static_result_cache.popitem(last=False)
+        else:
+            _static_result_cache.move_to_end(key)
+        
+        return {"errors": list(cached[0]), "warnings": list(cached[1])}
+    
+    def _find_deal_breaker(self, config_content: str) -> Optional[str]:
+        """Error for the first forbidden directive or dangerous include, if any"""
+        scanner = _build_deal_breaker_scanner(self.FORBIDDEN_DIRECTIVES, self.DANGEROUS_INCLUDE_PATTERNS)
+        match = scanner.search(config_content.lower())
+        if not match:
+            return None
+        index = int(match.lastgroup[1:])
+        if match.lastgroup[0] == 'f':
+            return f"Forbidden directive '{self.FORBIDDEN_DIRECTIVES[index]}' detected"
+        return f"Dangerous include pattern detected: {self.DANGEROUS_INCLUDE_PATTERNS[index]}"
+    
+    def _run_static_checks(self, config_content: str) -> Dict[str, List[str]]:
+        """Run the static checks (syntax, security, policy)"""
         errors = []
         warnings = []
         
+        # Pattern checks all run on one lowercased copy of the content
+        lowered = config_content.lower()
+        scanner = _build_static_scanner(
+            self.FORBIDDEN_DIRECTIVES, self.DANGEROUS_INCLUDE_PATTERNS, self.RECOMMENDED_SECURITY_HEADERS
+        )
+        found = {m.lastgroup for m in scanner.finditer(lowered)}
+        
         # Check for forbidden directives
-        for directive in self.FORBIDDEN_DIRECTIVES:
-            if directive in config_content:
+        for i, directive in enumerate(self.FORBIDDEN_DIRECTIVES):
+            if f"f{i}" in found:
                 errors.append(f"Forbidden directive '{directive}' detected")
         
         # Check for dangerous includes
-        for pattern in self.DANGEROUS_INCLUDE_PATTERNS:
-            if re.search(pattern, config_content, re.IGNORECASE):
+        for i, pattern in enumerate(self.DANGEROUS_INCLUDE_PATTERNS):
+            if f"d{i}" in found:
                 errors.append(f"Dangerous include pattern detected: {pattern}")
         
         # Check for basic syntax issues
         if not self._has_balanced_braces(config_content):
             errors.append("Unbalanced braces detected in configuration")
         
-        # Check server block structure
-        server_blocks = self._extract_server_blocks(config_content)
-        for i, block in enumerate(server_blocks):
-            block_errors = self._validate_server_block(block, i)
+        # Check server block structure, in place by offset rather than on copies
+        for i, (start, end) in enumerate(self._extract_server_blocks(lowered)):
+            block_errors = self._validate_server_block(lowered, start, end, i)
             errors.extend(block_errors)
         
         # Security recommendations
-        if not re.search(r'client_max_body_size\s+', config_content):
+        if "body_size" not in found:
             warnings.append("Consider setting client_max_body_size to prevent large uploads")
         
-        if not re.search(r'proxy_read_timeout\s+', config_content):
+        if "read_timeout" not in found:
             warnings.append("Consider setting proxy_read_timeout to prevent hanging connections")
         
         # Check for security headers
-        for header in self.RECOMMENDED_SECURITY_HEADERS:
-            if header not in config_content:
+        for i, header in enumerate(self.RECOMMENDED_SECURITY_HEADERS):
+            if f"h{i}" not in found:
                 warnings.append(f"Consider adding security header: {header}")
         
         return {"errors": errors, "warnings": warnings}
@@ -138,21 +310,34 @@ class NginxConfigValidator:
     async def _remote_nginx_test(self, config_content: str, vps_id: str, task_id: str) -> Dict:
         """Run nginx -t on remote VPS with candidate configuration"""
         try:
-            # Create temporary config file on remote host
+            # Write the candidate config to a temp file, test it and clean up in a
+            # single remote command, with the config fed through stdin. The cleanup
+            # runs from an exit trap, so it costs no round-trip of its own and still
+            # happens if the session is cut off. The nginx binary is looked up on
+            # the first test for a VPS (its path is printed on the first stdout
+            # line) and called by absolute path afterwards.
             temp_config_path = f"/tmp/nginx_test_{task_id}.conf"
+            nginx_path = _nginx_paths.get(vps_id)
+            if nginx_path:
+                locate = f'n={shlex.quote(nginx_path)}; '
+            else:
+                locate = 'n=$(command -v nginx) || exit 127; printf \'%s\\n\' "$n"; '
             
-            # Upload config content to temp file
-            await self.ssh_service.write_file(vps_id, temp_config_path, config_content)
-            
-            # Run nginx -t with the temp config
             result = await self.ssh_service.execute_command(
-                vps_id, 
-                f"nginx -t -c {temp_config_path}",
-                timeout=30
+                vps_id,
+                f'f={shlex.quote(temp_config_path)}; trap \'rm -f "$f"\' EXIT; trap \'exit 129\' HUP INT TERM; '
+                f'{locate}cat > "$f" || exit 1; "$n" -t -c "$f"',
+                timeout=30,
+                stdin=config_content
             )
             
-            # Clean up temp file
-            await self.ssh_service.execute_command(vps_id, f"rm -f {temp_config_path}")
+            if result['exit_code'] == NGINX_NOT_FOUND_EXIT_CODE:
+                # Missing binary or stale cached path: look it up again next time
+                _nginx_paths.pop(vps_id, None)
+            elif not nginx_path and result['exit_code'] >= 0:
+                found_path, _, result['stdout'] = result['stdout'].partition('\n')
+                if found_path:
+                    _nginx_paths[vps_id] = found_path
             
             if result['exit_code'] == 0:
                 return {
@@ -179,89 +364,91 @@ class NginxConfigValidator:
     
     def _has_balanced_braces(self, content: str) -> bool:
         """Check if braces are balanced in the configuration"""
+        # Without quotes or escapes every brace counts: differing totals settle it,
+        # otherwise the running depth over the braces alone is computed in C
+        if '"' not in content and "'" not in content and '\\' not in content:
+            if content.count('{') != content.count('}'):
+                return False
+            braces = _NON_BRACE_RE.sub('', content)
+            return not braces or min(accumulate(map(_BRACE_DEPTH_STEP.__getitem__, braces))) >= 0
+        
         open_count = 0
         in_string = False
-        escape_next = False
         
-        for char in content:
-            if escape_next:
-                escape_next = False
-                continue
-                
+        # Only escapes, quotes and braces matter, so step over those tokens alone
+        for match in _BRACE_TOKEN_RE.finditer(content):
+            char = match.group()[0]
+            
             if char == '\\':
-                escape_next = True
                 continue
                 
-            if char in ['"', "'"]:
+            if char in ('"', "'"):
                 in_string = not in_string
                 continue
                 
             if not in_string:
                 if char == '{':
                     open_count += 1
-                elif char == '}':
+                else:
                     open_count -= 1
                     if open_count < 0:
                         return False
         
         return open_count == 0
     
-    def _extract_server_blocks(self, content: str) -> List[str]:
-        """Extract server blocks from configuration"""
-        blocks = []
-        lines = content.split('\n')
-        current_block = []
-        in_server_block = False
-        brace_count = 0
-        
-        for line in lines:
-            stripped = line.strip()
-            if stripped.startswith('server {') or stripped.startswith('server{'):
-                in_server_block = True
-                current_block = [line]
-                brace_count = 1
-            elif in_server_block:
-                current_block.append(line)
-                brace_count += line.count('{') - line.count('}')
-                
-                if brace_count == 0:
-                    blocks.append('\n'.join(current_block))
-                    current_block = []
-                    in_server_block = False
+    def _extract_server_blocks(self, content: str) -> Iterator[Tuple[int, int]]:
+        """Yield the (start, end) offsets of the server blocks in the configuration"""
+        start = None
+        depth = 0
         
-        return blocks
+        # Track depth over the braces alone, outside strings and comments
+        for match in _SERVER_BLOCK_TOKEN_RE.finditer(content):
+            token = match.group()
+            if token[0] in '"\'#':
+                continue
+            if start is None:
+                if match.group('opener'):
+                    start = match.start('opener')
+                    depth = 1
+            elif token == '}':
+                depth -= 1
+                if depth == 0:
+                    yield start, match.end()
+                    start = None
+            else:
+                depth += 1
     
-    def _validate_server_block(self, block: str, block_index: int) -> List[str]:
-        """Validate individual server block"""
+    def _validate_server_block(self, content: str, start: int, end: int, block_index: int) -> List[str]:
+        """Validate the server block at content[start:end] (lowercased content)"""
         errors = []
         
+        # Find every directive of interest in one scan of the block
+        found = set()
+        size_str = None
+        for match in _SERVER_DIRECTIVE_RE.finditer(content, start, end):
+            kind = match.lastgroup
+            if kind == 'directive':
+                found.add(match.group())
+            elif kind == 'host_header':
+                found.add(kind)
+            elif size_str is None:
+                size_str = match.group('size')
+        
         # Check for required directives
-        if 'listen' not in block:
+        if 'listen' not in found:
             errors.append(f"Server block {block_index + 1}: Missing 'listen' directive")
         
-        if 'server_name' not in block:
+        if 'server_name' not in found:
             errors.append(f"Server block {block_index + 1}: Missing 'server_name' directive")
         
         # Check for potential issues
-        if 'proxy_pass' in block and 'proxy_set_header Host' not in block:
+        if 'proxy_pass' in found and 'host_header' not in found:
             errors.append(f"Server block {block_index + 1}: proxy_pass without proper Host header")
         
         # Check client_max_body_size limits
-        body_size_match = re.search(r'client_max_body_size\s+(\d+[kmg]?);', block, re.IGNORECASE)
-        if body_size_match:
-            size_str = body_size_match.group(1).lower()
+        if size_str is not None:
             try:
-                # Convert to MB for comparison
-                if size_str.endswith('g'):
-                    size_mb = int(size_str[:-1]) * 1024
-                elif size_str.endswith('k'):
-                    size_mb = int(size_str[:-1]) / 1024
-                elif size_str.endswith('m'):
-                    size_mb = int(size_str[:-1])
-                else:
-                    size_mb = int(size_str) / (1024 * 1024)  # bytes to MB
-                
-                if size_mb > 100:  # Limit to 100MB
+                if _size_in_bytes(size_str) > MAX_CLIENT_BODY_SIZE_BYTES:
                     errors.append(f"Server block {block_index + 1}: client_max_body_size too large ({size_str})")
             except ValueError:
                 errors.append(f"Server block {block_index + 1}: Invalid client_max_body_size format")
@@ -1,13 +1,24 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 import os
+import re
+import base64
+import binascii
 import json
 import logging
+import random
+import shlex
 import shutil
+import string
+import struct
+import time
 import uuid
 import asyncio
-from datetime import datetime, timezone
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, delete, and_, func, tuple_
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.database import AsyncSessionLocal
 from app.models.odoo_template import OdooTemplate, OdooTemplateFile, OdooDeployment
 from app.models.odoo_instance import OdooInstance
 from app.models.vps_host import VPSHost
@@ -19,6 +30,195 @@ import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Characters of a deployment name that cannot appear in container and database names
+_NAME_SEPARATOR_RE = re.compile(r"[-\s]+")
+
+
+def _sanitize_name(name: str) -> str:
+    """Lowercase a deployment name and replace dashes and whitespace with underscores"""
+    return _NAME_SEPARATOR_RE.sub("_", name.lower())
+
+
+# Prints the container's state as "<running>|<health>" once it is ready: running,
+# and healthy if the image defines a healthcheck. Otherwise it waits up to $wait
+# seconds for a start or health event, then prints the state as it is at that
+# point. The event stream is subscribed before the first check so an event in
+# between is not missed. docker inspect reads just this container's record.
+_CONTAINER_READY_SCRIPT = string.Template("""name='$name'
+fifo=$$(mktemp -u) && mkfifo "$$fifo" && exec 3<>"$$fifo" && rm -f "$$fifo"
+docker events --filter container="$$name" --filter event=start --filter event=health_status \\
+    --format '{{.Status}}' >&3 2>/dev/null &
+events_pid=$$!
+trap 'kill $$events_pid 2>/dev/null' EXIT
+state() { docker inspect -f '{{.State.Running}}|{{if .State.Health}}{{.State.Health.Status}}{{end}}' "$$name" 2>/dev/null; }
+status=$$(state)
+case "$$status" in "true|" | "true|healthy") echo "$$status"; exit 0;; esac
+read -r -t $wait _ <&3
+state
+""")
+
+# The wait for a start event doubles after every check, up to the maximum
+CONTAINER_READY_INITIAL_WAIT_SECONDS = 5
+CONTAINER_READY_MAX_WAIT_SECONDS = 60
+
+# Delay before the next check when one returns early without the container being up
+CONTAINER_READY_INITIAL_RETRY_DELAY = 0.25
+CONTAINER_READY_MAX_RETRY_DELAY = 5.0
+
+
+def _as_uuid(value) -> uuid.UUID:
+    """Primary keys are UUIDs; session.get only hits the identity map with a UUID"""
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+async def _count_rows(count_query) -> int:
+    """Run a COUNT query on a short-lived session, so it can run concurrently with
+    a query on the caller's session"""
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(count_query)).scalar_one()
+
+
+async def _stat_file(path: str) -> Optional[os.stat_result]:
+    """stat() a local file in the default executor; None if it does not exist"""
+    try:
+        return await asyncio.get_event_loop().run_in_executor(None, os.stat, path)
+    except FileNotFoundError:
+        return None
+
+
+# Template listing cursors: created_at as microseconds since the epoch, then the id
+_TEMPLATE_CURSOR_FORMAT = struct.Struct(">q16s")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_template_cursor(template: OdooTemplate) -> str:
+    """Encode the (created_at, id) key of the last listed template as an opaque cursor"""
+    created_at = template.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1)
+    packed = _TEMPLATE_CURSOR_FORMAT.pack(micros, template.id.bytes)
+    return base64.urlsafe_b64encode(packed).decode('ascii').rstrip('=')
+
+
+def _decode_template_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decode a cursor produced by _encode_template_cursor; ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        micros, id_bytes = _TEMPLATE_CURSOR_FORMAT.unpack(
+            base64.b64decode(padded, altchars=b'-_', validate=True)
+        )
+        return _EPOCH + timedelta(microseconds=micros), uuid.UUID(bytes=id_bytes)
+    except (binascii.Error, struct.error, ValueError, OverflowError):
+        raise ValueError("Invalid pagination cursor") from None
+
+# Local address column of ``ss``/``netstat`` output, e.g. ``0.0.0.0:8069`` or ``[::]:8069``
+_LISTEN_ADDRESS_PORT_RE = re.compile(r"\S:(\d+)(?=\s)")
+
+
+def _parse_listening_ports(output: str) -> set:
+    """Collect the ports of all listening sockets from ``ss``/``netstat -tuln`` output"""
+    return {int(port) for port in _LISTEN_ADDRESS_PORT_RE.findall(output)}
+
+
+# Odoo configuration file written for every deployment. Template-specific options
+# are appended as $extra, rendered once per template revision. It holds the database
+# and master passwords, so it only ever lives in ODOO_SECRETS_DIR; passing them any
+# other way (e.g. $PASSWORD, which the image's entrypoint turns into --db_password)
+# would put them on the odoo command line.
+_ODOO_CONFIG_TEMPLATE = string.Template("""[options]
+db_host = $db_host
+db_port = $db_port
+db_user = $db_user
+db_password = $db_password
+xmlrpc_port = $xmlrpc_port
+xmlrpc_interface = 0.0.0.0
+admin_passwd = $admin_passwd
+db_name = $db_name
+without_demo = True
+list_db = False
+addons_path = /usr/lib/python3/dist-packages/odoo/addons,/mnt/extra-addons
+db_maxconn = 64
+db_template = template0
+limit_memory_soft = 2147483648
+limit_memory_hard = 2684354560
+limit_time_cpu = 600
+limit_time_real = 1200
+limit_time_real_cron = 1200
+$extra""")
+
+# Options a template's config_template cannot override
+_RESERVED_CONFIG_KEYS = frozenset({'db_host', 'db_port', 'db_user', 'db_password', 'xmlrpc_port'})
+
+# Directory on the VPS, private to the SSH user, holding each container's
+# configuration file. Expanded by the remote shell. It is on disk rather than on a
+# tmpfs so containers still find their configuration when restarted after a reboot.
+ODOO_SECRETS_DIR = "$HOME/.odoo_secrets"
+
+# uid of the odoo user the official images run as; the configuration file is mode
+# 0600 and owned by it, so only Odoo can read it inside the container
+ODOO_CONTAINER_UID = 101
+
+# Prefix for remote commands that need the database password: it is read from the
+# first stdin line, so it never appears in the command line or needs shell quoting
+PG_PASSWORD_FROM_STDIN = "IFS= read -r PGPASSWORD && export PGPASSWORD && "
+
+# Written to stderr between createdb and pg_restore, which run in one SSH command
+RESTORE_PHASE_MARKER = "__SAAS_RESTORE_PHASE__"
+
+CONFIG_EXTRA_CACHE_MAX_SIZE = 256
+_config_extra_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _render_config_extra(template: OdooTemplate) -> str:
+    """Render the template-specific config lines, cached per template id and revision"""
+    if not template.config_template:
+        return ""
+    
+    key = (template.id, template.updated_at)
+    extra = _config_extra_cache.get(key)
+    if extra is None:
+        extra = "".join(
+            f"{option} = {value}\n"
+            for option, value in template.config_template.items()
+            if option not in _RESERVED_CONFIG_KEYS
+        )
+        _config_extra_cache[key] = extra
+        if len(_config_extra_cache) > CONFIG_EXTRA_CACHE_MAX_SIZE:
+            _config_extra_cache.popitem(last=False)
+    else:
+        _config_extra_cache.move_to_end(key)
+    return extra
+
+
+HOST_INFO_CACHE_TTL_SECONDS = 60
+HOST_INFO_CACHE_MAX_SIZE = 256
+_host_info_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _build_host_info(vps: VPSHost) -> Dict[str, Any]:
+    """Connection details for a VPS in the shape SSHService expects, cached by VPS id"""
+    host_info = {
+        'ip_address': vps.ip_address,
+        'port': vps.port,
+        'username': vps.username,
+        'password_encrypted': vps.password_encrypted,
+        'private_key_encrypted': vps.private_key_encrypted
+    }
+    key = str(vps.id)
+    if key not in _host_info_cache and len(_host_info_cache) >= HOST_INFO_CACHE_MAX_SIZE:
+        _host_info_cache.pop(next(iter(_host_info_cache)), None)
+    _host_info_cache[key] = (time.monotonic() + HOST_INFO_CACHE_TTL_SECONDS, host_info)
+    return host_info
+
+
+def invalidate_host_info(vps_id: Optional[str] = None) -> None:
+    """Drop the cached connection details of a VPS, or all of them when no ID is given"""
+    if vps_id is None:
+        _host_info_cache.clear()
+    else:
+        _host_info_cache.pop(str(vps_id), None)
+
 
 class OdooDeploymentService:
     """Service for managing Odoo template deployments"""
@@ -28,48 +228,62 @@ class OdooDeploymentService:
         self.ssh_service = SSHService()
         self.docker_service = DockerService(self.ssh_service, AuditService(db))
         self.audit_service = AuditService(db)
+        self._progress_tasks: Set[asyncio.Task] = set()
     
     async def get_templates(self, industry: Optional[str] = None, version: Optional[str] = None, 
-                           is_public: bool = True, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
-        """Get available Odoo templates with filtering"""
+                           is_public: bool = True, page: int = 1, per_page: int = 20,
+                           cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get available Odoo templates with filtering.
+        
+        Templates are ordered newest first, by created_at with the id breaking ties.
+        Passing the next_cursor of a previous result continues after its last
+        template without an OFFSET scan; page is only used when no cursor is given.
+        Raises ValueError for a cursor that was not produced by this method.
+        """
+        cursor_key = _decode_template_cursor(cursor) if cursor else None
         try:
-            query = select(OdooTemplate).where(OdooTemplate.is_active == True)
-            
+            filters = [OdooTemplate.is_active == True]
             if industry:
-                query = query.where(OdooTemplate.industry == industry)
+                filters.append(OdooTemplate.industry == industry)
             if version:
-                query = query.where(OdooTemplate.version == version)
+                filters.append(OdooTemplate.version == version)
             if is_public is not None:
-                query = query.where(OdooTemplate.is_public == is_public)
+                filters.append(OdooTemplate.is_public == is_public)
             
-            # Add pagination
-            offset = (page - 1) * per_page
-            query = query.offset(offset).limit(per_page)
+            # Add pagination; one extra row tells whether there is a next page
+            query = select(OdooTemplate).where(and_(*filters)).order_by(
+                OdooTemplate.created_at.desc(), OdooTemplate.id.desc()
+            )
+            if cursor_key:
+                query = query.where(
+                    tuple_(OdooTemplate.created_at, OdooTemplate.id) < tuple_(*cursor_key)
+                )
+            else:
+                query = query.offset((page - 1) * per_page)
+            query = query.limit(per_page + 1)
             
             result = await self.db.execute(query)
             templates = result.scalars().all()
             
-            # Get total count
-            count_query = select(OdooTemplate).where(OdooTemplate.is_active == True)
-            if industry:
-                count_query = count_query.where(OdooTemplate.industry == industry)
-            if version:
-                count_query = count_query.where(OdooTemplate.version == version)
-            if is_public is not None:
-                count_query = count_query.where(OdooTemplate.is_public == is_public)
+            next_cursor = None
+            if len(templates) > per_page:
+                templates = templates[:per_page]
+                next_cursor = _encode_template_cursor(templates[-1])
             
-            count_result = await self.db.execute(count_query)
-            total = len(count_result.scalars().all())
+            # Get total count
+            count_query = select(func.count()).select_from(OdooTemplate).where(and_(*filters))
+            total = (await self.db.execute(count_query)).scalar_one()
             
             return {
                 "templates": templates,
                 "total": total,
                 "page": page,
-                "per_page": per_page
+                "per_page": per_page,
+                "next_cursor": next_cursor
             }
         except Exception as e:
             logger.error(f"Failed to get templates: {e}")
-            return {"templates": [], "total": 0, "page": page, "per_page": per_page}
+            return {"templates": [], "total": 0, "page": page, "per_page": per_page, "next_cursor": None}
     
     async def create_template(self, name: str, industry: str, version: str,
                              backup_file_path: str, admin_id: str, **kwargs) -> Optional[OdooTemplate]:
@@ -95,8 +309,9 @@ class OdooDeploymentService:
             )
 
             # Set backup file size if file exists
-            if backup_file_path and os.path.exists(backup_file_path):
-                template.backup_file_size = os.path.getsize(backup_file_path)
+            backup_stat = await _stat_file(backup_file_path) if backup_file_path else None
+            if backup_stat:
+                template.backup_file_size = backup_stat.st_size
                 template.backup_created_at = datetime.now(timezone.utc)
                 template.backup_odoo_version = version
             
@@ -105,7 +320,7 @@ class OdooDeploymentService:
             await self.db.refresh(template)
             
             # Log template creation
-            await self.audit_service.log_action(
+            await self.audit_service.enqueue(
                 task_id=generate_secure_token(8),
                 action="odoo_template_create",
                 resource_type="odoo_template",
@@ -129,9 +344,7 @@ class OdooDeploymentService:
     async def get_template(self, template_id: str) -> Optional[OdooTemplate]:
         """Get a specific template by ID"""
         try:
-            query = select(OdooTemplate).where(OdooTemplate.id == template_id)
-            result = await self.db.execute(query)
-            return result.scalar_one_or_none()
+            return await self.db.get(OdooTemplate, _as_uuid(template_id))
         except Exception as e:
             logger.error(f"Failed to get template {template_id}: {e}")
             return None
@@ -145,14 +358,15 @@ class OdooDeploymentService:
                 return False
             
             # Check if template has any active deployments
-            deployment_query = select(OdooDeployment).where(
-                OdooDeployment.template_id == template_id,
-                OdooDeployment.status.in_(['pending', 'running'])
+            deployment_query = select(
+                select(OdooDeployment.id).where(
+                    OdooDeployment.template_id == template_id,
+                    OdooDeployment.status.in_(['pending', 'running'])
+                ).exists()
             )
-            deployment_result = await self.db.execute(deployment_query)
-            active_deployments = deployment_result.scalars().all()
+            has_active_deployments = (await self.db.execute(deployment_query)).scalar()
             
-            if active_deployments:
+            if has_active_deployments:
                 raise ValueError("Cannot delete template with active deployments")
             
             # Delete template
@@ -160,7 +374,7 @@ class OdooDeploymentService:
             await self.db.commit()
             
             # Log template deletion
-            await self.audit_service.log_action(
+            await self.audit_service.enqueue(
                 task_id=generate_secure_token(8),
                 action="odoo_template_delete",
                 resource_type="odoo_template", 
@@ -180,41 +394,24 @@ class OdooDeploymentService:
             await self.db.rollback()
             raise
     
-    async def find_available_port(self, vps_id: str, start_port: int = 8001, end_port: int = 8100) -> int:
+    async def find_available_port(self, vps: VPSHost, host_info: dict,
+                                  start_port: int = 8001, end_port: int = 8100) -> int:
         """Find an available port on the VPS for the new Odoo instance"""
+        vps_id = vps.id
         try:
-            # Get VPS connection info
-            vps_query = select(VPSHost).where(VPSHost.id == vps_id)
-            vps_result = await self.db.execute(vps_query)
-            vps = vps_result.scalar_one_or_none()
-
-            if not vps:
-                raise ValueError("VPS not found")
-
-            host_info = {
-                'ip_address': vps.ip_address,
-                'port': vps.port,
-                'username': vps.username,
-                'password_encrypted': vps.password_encrypted,
-                'private_key_encrypted': vps.private_key_encrypted
-            }
-
-            # Use improved port detection logic (same as simple-deploy)
-            for test_port in range(start_port, end_port + 1):
-                # Check if port is in use with simple netstat command
-                check_cmd = f"netstat -tuln | grep ':{test_port} ' || echo 'PORT_AVAILABLE'"
-                result = await self.ssh_service.execute_command(vps_id, check_cmd, host_info=host_info)
-
-                # If netstat finds nothing or command succeeds with PORT_AVAILABLE, port is free
-                if result.get("success"):
-                    output = result.get("stdout", "").strip()
-                    print(f"Port {test_port} check output: '{output}'")
+            # List every listening socket in one round-trip instead of probing
+            # each port of the range separately
+            check_cmd = "ss -tuln 2>/dev/null || netstat -tuln"
+            result = await self.ssh_service.execute_command(vps_id, check_cmd, host_info=host_info)
+            if not result.get("success"):
+                raise ValueError(f"Failed to list listening ports on VPS {vps_id}: {result.get('stderr', 'Unknown error')}")
 
-                    # Port is available if netstat finds no matches (returns only PORT_AVAILABLE)
-                    if output == "PORT_AVAILABLE" or not output or "PORT_AVAILABLE" in output:
-                        logger.info(f"Found available port {test_port} on VPS {vps_id}")
-                        print(f"Using available port: {test_port}")
-                        return test_port
+            used_ports = _parse_listening_ports(result.get("stdout", ""))
+            free_ports = set(range(start_port, end_port + 1)) - used_ports
+            if free_ports:
+                test_port = min(free_ports)
+                logger.info(f"Found available port {test_port} on VPS {vps_id}")
+                return test_port
 
             raise ValueError(f"No available ports in range {start_port}-{end_port} on VPS {vps_id}")
         except Exception as e:
@@ -233,15 +430,16 @@ class OdooDeploymentService:
             if not template or not template.is_available:
                 raise ValueError("Template not found or not available")
             
-            # Get VPS
-            vps_query = select(VPSHost).where(VPSHost.id == vps_id)
-            vps_result = await self.db.execute(vps_query)
-            vps = vps_result.scalar_one_or_none()
+            # Get VPS once; the row and its connection info are reused for the
+            # whole deployment
+            vps = await self.db.get(VPSHost, _as_uuid(vps_id))
             if not vps:
                 raise ValueError("VPS not found")
             
+            host_info = _build_host_info(vps)
+            
             # Find available port
-            port = await self.find_available_port(vps_id, 
+            port = await self.find_available_port(vps, host_info,
                                                 template.default_port_range_start,
                                                 template.default_port_range_end)
             
@@ -250,31 +448,25 @@ class OdooDeploymentService:
             
             # Generate unique database name and admin password
             unique_suffix = str(uuid.uuid4())[:8]
-            db_name = f"odoo_{deployment_name.lower().replace('-', '_').replace(' ', '_')}_{unique_suffix}"
+            base_name = _sanitize_name(deployment_name)
+            db_name = f"odoo_{base_name}_{unique_suffix}"
             admin_password = kwargs.get('admin_password') or generate_secure_token(16)
 
             # Ensure admin_password is a string
             if not isinstance(admin_password, str):
                 admin_password = str(admin_password)
 
-            print(f"Admin password type: {type(admin_password)}, value length: {len(admin_password)}")
-            
             # Generate deployment ID
             deployment_id = str(uuid.uuid4())            
-            deployment_name = f"{deployment_name.lower().replace('-', '_').replace(' ', '_')}_{deployment_id[:8]}"
+            deployment_name = f"{base_name}_{deployment_id[:8]}"
             
     
             
-            print("Preparing to create deployment record")
-
             # Encrypt admin password with better error handling
             try:
-                print(f"Encrypting password: {admin_password[:5]}...")
                 encrypted_password = encrypt_data(admin_password)
-                print("Password encrypted successfully")
             except Exception as e:
                 logger.error(f"Failed to encrypt admin password: {e}")
-                print(f"Encryption error: {e}")
                 raise
 
             # Create deployment record
@@ -294,22 +486,25 @@ class OdooDeploymentService:
                 started_at=datetime.now(timezone.utc)
             )
             
-            print("Created deployment record")
-            
             self.db.add(deployment)
             
-            print("Added deployment to DB session")
             await self.db.commit()
-            print("Committed DB session")
             await self.db.refresh(deployment)
-            print("Refreshed deployment from DB")
             
             # Start deployment process - remove admin_password from kwargs to avoid duplicate
             kwargs_without_admin_password = {k: v for k, v in kwargs.items() if k != 'admin_password'}
-            await self._deploy_container(deployment, template, vps, admin_password, **kwargs_without_admin_password)
+            await self._deploy_container(deployment, template, vps, host_info, admin_password,
+                                         **kwargs_without_admin_password)
             
-            # Increment template deployment counter
-            template.increment_deployment_count()
+            # Increment template deployment counter in the database, so concurrent
+            # deployments of the same template cannot lose an update
+            count_result = await self.db.execute(
+                update(OdooTemplate)
+                .where(OdooTemplate.id == template.id)
+                .values(deployment_count=OdooTemplate.deployment_count + 1)
+                .returning(OdooTemplate.deployment_count)
+            )
+            set_committed_value(template, "deployment_count", count_result.scalar_one())
             await self.db.commit()
             
             return deployment
@@ -322,42 +517,58 @@ class OdooDeploymentService:
                 await self.db.commit()
             return deployment
     
+    async def _save_progress(self, deployment: OdooDeployment, progress: int):
+        """Store deployment progress through a short-lived session of its own, so
+        progress ticks neither flush nor hold the caller's session"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(OdooDeployment)
+                .where(OdooDeployment.id == deployment.id)
+                .values(progress=progress)
+            )
+            await db.commit()
+        set_committed_value(deployment, "progress", progress)
+    
+    def _report_progress(self, deployment: OdooDeployment, progress: int):
+        """Store deployment progress in the background, so the write overlaps with
+        the next deployment step instead of delaying it"""
+        task = asyncio.create_task(self._save_progress(deployment, progress))
+        self._progress_tasks.add(task)
+        task.add_done_callback(self._progress_tasks.discard)
+    
+    async def _wait_for_progress(self):
+        """Wait for background progress writes, so they cannot land after the final status"""
+        if not self._progress_tasks:
+            return
+        results = await asyncio.gather(*self._progress_tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to store deployment progress: {result}")
+    
     async def _deploy_container(self, deployment: OdooDeployment, template: OdooTemplate,
-                               vps: VPSHost, admin_password: str, **kwargs):
+                               vps: VPSHost, host_info: dict, admin_password: str, **kwargs):
         """Deploy the actual Docker container"""
         try:
             deployment.status = "deploying"
             deployment.progress = 10
             await self.db.commit()
 
-            # Get VPS connection info
-            host_info = {
-                'ip_address': vps.ip_address,
-                'port': vps.port,
-                'username': vps.username,
-                'password_encrypted': vps.password_encrypted,
-                'private_key_encrypted': vps.private_key_encrypted
-            }
-
             # Connect to VPS
             ssh_client = await self.ssh_service.get_connection(vps.id, host_info)
             if not ssh_client:
                 raise Exception("Failed to connect to VPS")
 
-            deployment.progress = 20
-            await self.db.commit()
-
             # Create container name
-            container_name = f"odoo_{deployment.deployment_name.lower().replace('-', '_').replace(' ', '_')}"
+            # deployment_name is sanitized when the deployment is created
+            container_name = f"odoo_{deployment.deployment_name}"
 
             # Get database credentials from kwargs or use defaults
-            print(f"DEBUG: kwargs received: {kwargs}")
             db_host = kwargs.get('db_host')
             db_port = kwargs.get('db_port')
             db_name = kwargs.get('db_name', deployment.db_name)
             db_user = kwargs.get('db_user')
             db_password = kwargs.get('db_password')
-            print(f"DEBUG: Parsed DB values - host:{db_host}, port:{db_port}, user:{db_user}, name:{db_name}")
+            logger.debug("Parsed DB values host=%s port=%s user=%s name=%s", db_host, db_port, db_user, db_name)
 
             # Update deployment object with database credentials for Docker command
             deployment.db_host = db_host
@@ -372,82 +583,59 @@ class OdooDeploymentService:
             if not db_password:
                 raise Exception("Database password is required for external PostgreSQL connection")
 
-            # Prepare base environment variables for Odoo
-            env_vars = {
-                "POSTGRES_HOST": db_host,
-                "POSTGRES_PORT": str(db_port),
-                "POSTGRES_DB": db_name,
-                "POSTGRES_USER": db_user,
-                "POSTGRES_PASSWORD": db_password,
-                "ODOO_DB": db_name,
-                "ODOO_ADMIN_PASSWD": admin_password
-            }
-
-            # Add template environment variables
-            if template.env_vars_template:
-                env_vars.update(template.env_vars_template)
-
-            # Add custom environment variables
-            if deployment.custom_env_vars:
-                env_vars.update(deployment.custom_env_vars)
-
-            deployment.progress = 30
-            await self.db.commit()
-
             # Create unique database on PostgreSQL server
             await self._create_database(vps.id, host_info, db_host, db_port, db_user, db_password, db_name)
 
-            deployment.progress = 40
-            await self.db.commit()
-
             # Copy backup file to VPS if needed
             remote_backup_path = None
-            if template.backup_file_path and os.path.exists(template.backup_file_path):
+            if template.backup_file_path and await _stat_file(template.backup_file_path):
                 remote_backup_path = f"/tmp/{deployment.db_name}_backup.zip"
-                await self._copy_backup_to_vps(template.backup_file_path, remote_backup_path, host_info)
-                deployment.progress = 50
-                await self.db.commit()
+                await self._copy_backup_to_vps(vps.id, template.backup_file_path, remote_backup_path, host_info)
+
+            # Database and backup are in place; the container steps remain
+            self._report_progress(deployment, 50)
 
             # Create Docker run command using proper Odoo configuration file approach
             docker_image = template.docker_image or f"odoo:{deployment.selected_version}"
-            config_file_path = f"/tmp/odoo_{container_name}.conf"
+            config_file_path = f"{ODOO_SECRETS_DIR}/{container_name}.conf"
 
             # Step 1: Create Odoo configuration file
-            odoo_config = f"""[options]
-db_host = {deployment.db_host}
-db_port = {deployment.db_port}
-db_user = {deployment.db_user}
-db_password = {deployment.db_password}
-xmlrpc_port = {deployment.port}
-xmlrpc_interface = 0.0.0.0
-admin_passwd = {admin_password}
-db_name = {deployment.db_name}
-without_demo = True
-list_db = False
-addons_path = /usr/lib/python3/dist-packages/odoo/addons,/mnt/extra-addons
-db_maxconn = 64
-db_template = template0
-limit_memory_soft = 2147483648
-limit_memory_hard = 2684354560
-limit_time_cpu = 600
-limit_time_real = 1200
-limit_time_real_cron = 1200
-"""
-
-            # Add template-specific configuration if available
-            if template.config_template:
-                for key, value in template.config_template.items():
-                    if key not in ['db_host', 'db_port', 'db_user', 'db_password', 'xmlrpc_port']:
-                        odoo_config += f"{key} = {value}\n"
-
-            # Step 1 Command: Create configuration file
-            create_config_cmd = f"""cat > {config_file_path} << 'EOF'
-{odoo_config}EOF"""
+            odoo_config = _ODOO_CONFIG_TEMPLATE.substitute(
+                db_host=deployment.db_host,
+                db_port=deployment.db_port,
+                db_user=deployment.db_user,
+                db_password=deployment.db_password,
+                xmlrpc_port=deployment.port,
+                admin_passwd=admin_password,
+                db_name=deployment.db_name,
+                extra=_render_config_extra(template)
+            )
 
-            # Step 2: Disable firewall if needed (optional, depends on VPS setup)
-            disable_firewall_cmd = "sudo ufw disable 2>/dev/null || true"
+            # Step 1 Command: Clean up any existing container and config (including
+            # the /tmp config and env file older deployments used), write the
+            # configuration file and disable the firewall (optional, depends on VPS
+            # setup) in a single remote shell. The file is fed through stdin, so no
+            # secret is ever quoted into the shell command, and created mode 0600
+            # before being handed to the container's user. Unless logged in as root,
+            # the chown runs as root in a throwaway container of the same image, so
+            # it needs docker rather than sudo; only the file write and the chown
+            # decide the exit status
+            owner = f"{ODOO_CONTAINER_UID}:{ODOO_CONTAINER_UID}"
+            prepare_cmd = (
+                f"docker rm -f {container_name} 2>/dev/null || true; "
+                f"rm -f {config_file_path} /tmp/odoo_{container_name}.conf "
+                f"{ODOO_SECRETS_DIR}/{container_name}.env 2>/dev/null || true; "
+                f"(umask 077 && mkdir -p {ODOO_SECRETS_DIR} && cat > {config_file_path}) || exit $?; "
+                f"if [ \"$(id -u)\" = 0 ]; then chown {owner} {config_file_path}; "
+                f"else docker run --rm --user 0 --entrypoint chown -v {ODOO_SECRETS_DIR}:/secrets "
+                f"{docker_image} {owner} /secrets/{container_name}.conf; fi || exit $?; "
+                f"sudo ufw disable 2>/dev/null || true"
+            )
 
-            # Step 3: Docker run command with proper configuration
+            # Step 2: Docker run command with proper configuration. odoo is started
+            # directly rather than through the image's entrypoint, which copies the
+            # db_* options out of the configuration file onto odoo's command line;
+            # odoo reads them from the file itself ($ODOO_RC)
             docker_cmd = (
                 f"docker run -d "
                 f"--name {container_name} "
@@ -461,151 +649,57 @@ limit_time_real_cron = 1200
                 f"-v /opt/odoo-extra-addons:/mnt/extra-addons:ro "
                 f"--memory={template.default_memory_limit or '1g'} "
                 f"--cpus={template.default_cpu_limit or '1'} "
-                f"{docker_image} -- --init=base --without-demo=all"
+                f"--entrypoint odoo "
+                f"{docker_image} --init=base --without-demo=all"
             )
 
             # Log the complete deployment process
-            print("#########################################")
-            print("ODOO DEPLOYMENT USING CONFIGURATION FILE:")
-            print(f"VPS: {vps.ip_address}:{vps.port}")
-            print(f"Container: {container_name}")
-            print(f"Config File: {config_file_path}")
-            print(f"Database: {db_host}:{db_port}/{db_name}")
-            print(f"Access URL: http://{vps.ip_address}:{deployment.port}/")
-            print("#########################################")
-
-            deployment.progress = 55
-            await self.db.commit()
-
-            # Step 1: Clean up any existing container and config
-            cleanup_commands = [
-                f"docker rm -f {container_name} 2>/dev/null || true",
-                f"rm -f {config_file_path} 2>/dev/null || true"
-            ]
-
-            for cleanup_cmd in cleanup_commands:
-                print("#########################################")
-                print("EXECUTING CLEANUP COMMAND:")
-                print(f"Command: {cleanup_cmd}")
-                print("#########################################")
-
-                cleanup_result = await self.ssh_service.execute_command(vps.id, cleanup_cmd, host_info=host_info)
-
-                print("#########################################")
-                print("CLEANUP RESULT:")
-                print(f"Success: {cleanup_result.get('success', False)}")
-                print(f"STDOUT: {cleanup_result.get('stdout', '')}")
-                print(f"STDERR: {cleanup_result.get('stderr', '')}")
-                print("#########################################")
+            logger.debug("Deploying %s on %s:%s with config %s, database %s:%s/%s",
+                         container_name, vps.ip_address, vps.port, config_file_path, db_host, db_port, db_name)
 
-            deployment.progress = 60
-            await self.db.commit()
-
-            # Step 2: Create Odoo configuration file
-            print("#########################################")
-            print("CREATING ODOO CONFIGURATION FILE:")
-            print(f"Config File Path: {config_file_path}")
-            print("Configuration Content:")
-            print(odoo_config)
-            print(f"Command: {create_config_cmd}")
-            print("#########################################")
-
-            config_result = await self.ssh_service.execute_command(vps.id, create_config_cmd, host_info=host_info)
-
-            print("#########################################")
-            print("CONFIG FILE CREATION RESULT:")
-            print(f"Success: {config_result.get('success', False)}")
-            print(f"STDOUT: {config_result.get('stdout', '')}")
-            print(f"STDERR: {config_result.get('stderr', '')}")
-            print("#########################################")
-
-            if not config_result.get("success"):
-                raise Exception(f"Failed to create Odoo configuration file: {config_result.get('stderr', 'Unknown error')}")
+            # Step 1: Clean up, create Odoo configuration file and disable firewall
+            logger.debug("Preparing VPS for %s: %s", container_name, prepare_cmd)
 
-            deployment.progress = 65
-            await self.db.commit()
-
-            # Step 3: Disable firewall (optional, but helps with connectivity)
-            print("#########################################")
-            print("DISABLING FIREWALL (OPTIONAL):")
-            print(f"Command: {disable_firewall_cmd}")
-            print("#########################################")
-
-            firewall_result = await self.ssh_service.execute_command(vps.id, disable_firewall_cmd, host_info=host_info)
+            prepare_result = await self.ssh_service.execute_command(
+                vps.id, prepare_cmd, host_info=host_info,
+                stdin=odoo_config
+            )
 
-            print("#########################################")
-            print("FIREWALL DISABLE RESULT:")
-            print(f"Success: {firewall_result.get('success', False)}")
-            print(f"STDOUT: {firewall_result.get('stdout', '')}")
-            print(f"STDERR: {firewall_result.get('stderr', '')}")
-            print("#########################################")
+            logger.debug("VPS preparation result success=%s stdout=%s stderr=%s",
+                         prepare_result.get('success', False), prepare_result.get('stdout', ''),
+                         prepare_result.get('stderr', ''))
 
-            deployment.progress = 70
-            await self.db.commit()
+            if not prepare_result.get("success"):
+                raise Exception(f"Failed to create Odoo configuration file: {prepare_result.get('stderr', 'Unknown error')}")
 
-            # Step 4: Execute Docker command with configuration file
-            print("#########################################")
-            print("EXECUTING MAIN DOCKER DEPLOYMENT COMMAND:")
-            print(f"VPS: {vps.ip_address}:{vps.port}")
-            print(f"Container Name: {container_name}")
-            print(f"Network Mode: host (no port mapping needed)")
-            print(f"Config Volume: {config_file_path}:/etc/odoo/odoo.conf:ro")
-            print(f"Full Command: {docker_cmd}")
-            print("#########################################")
+            # Step 2: Execute Docker command with configuration file
+            logger.debug("Docker run command for %s: %s", container_name, docker_cmd)
 
             result = await self.ssh_service.execute_command(vps.id, docker_cmd, host_info=host_info)
 
-            print("#########################################")
-            print("DOCKER DEPLOYMENT COMMAND RESULT:")
-            print(f"Success: {result.get('success', False)}")
-            print(f"STDOUT: {result.get('stdout', '')}")
-            print(f"STDERR: {result.get('stderr', '')}")
-            print(f"Return Code: {result.get('return_code', 'N/A')}")
-            print("#########################################")
+            logger.debug("Docker run result success=%s return_code=%s stdout=%s stderr=%s",
+                         result.get('success', False), result.get('return_code', 'N/A'),
+                         result.get('stdout', ''), result.get('stderr', ''))
 
             if not result.get("success"):
                 raise Exception(f"Failed to start container: {result.get('stderr', 'Unknown error')}")
 
-            deployment.progress = 75
-            await self.db.commit()
-
             # Wait for container to be ready
-            print("#########################################")
-            print("CHECKING CONTAINER READINESS:")
-            print(f"Container Name: {container_name}")
-            print(f"VPS: {vps.ip_address}:{vps.port}")
-            print("#########################################")
+            logger.debug("Waiting for container %s on %s to become ready", container_name, vps.ip_address)
 
             await self._wait_for_container_ready(vps.id, container_name, host_info)
 
-            print("#########################################")
-            print("CONTAINER READINESS CHECK COMPLETED")
-            print(f"Container {container_name} is now ready")
-            print("#########################################")
-
-            deployment.progress = 80
-            await self.db.commit()
+            logger.debug("Container %s is ready", container_name)
 
             # Restore backup if available (for external PostgreSQL)
             if template.backup_file_path and remote_backup_path:
-                print("#########################################")
-                print("STARTING BACKUP RESTORATION:")
-                print(f"Backup File: {remote_backup_path}")
-                print(f"Target Database: {db_host}:{db_port}/{db_name}")
-                print(f"Database User: {db_user}")
-                print("#########################################")
+                logger.debug("Restoring %s into %s:%s/%s as %s", remote_backup_path, db_host, db_port, db_name, db_user)
 
                 await self._restore_backup_external(vps.id, container_name, db_name,
                                                    remote_backup_path, host_info,
                                                    db_host, db_port, db_user, db_password)
 
-                print("#########################################")
-                print("BACKUP RESTORATION COMPLETED")
-                print(f"Database {db_name} restored from {remote_backup_path}")
-                print("#########################################")
-
-                deployment.progress = 90
-                await self.db.commit()
+                logger.debug("Database %s restored from %s", db_name, remote_backup_path)
 
             # Create OdooInstance record with proper configuration
             instance = OdooInstance(
@@ -635,6 +729,7 @@ limit_time_real_cron = 1200
             await self.db.refresh(instance)
 
             # Update deployment
+            await self._wait_for_progress()
             deployment.instance_id = instance.id
             deployment.status = "completed"
             deployment.progress = 100
@@ -642,7 +737,7 @@ limit_time_real_cron = 1200
             await self.db.commit()
 
             # Log successful deployment
-            await self.audit_service.log_action(
+            await self.audit_service.enqueue(
                 task_id=generate_secure_token(8),
                 action="odoo_deploy_success",
                 resource_type="odoo_deployment",
@@ -665,20 +760,12 @@ limit_time_real_cron = 1200
             )
 
             # Final deployment summary
-            print("#########################################")
-            print("🎉 ODOO DEPLOYMENT COMPLETED SUCCESSFULLY!")
-            print(f"📍 VPS: {vps.ip_address}:{vps.port}")
-            print(f"🐳 Container: {container_name}")
-            print(f"📊 Database: {db_host}:{db_port}/{db_name}")
-            print(f"⚙️  Config File: {config_file_path}")
-            print(f"🌐 Access URL: http://{vps.ip_address}:{deployment.port}/")
-            print(f"👤 Admin Password: {admin_password}")
-            print(f"📋 Template: {template.name} (v{deployment.selected_version})")
-            print(f"🏭 Industry: {template.industry}")
-            print("#########################################")
+            logger.info("Odoo deployment %s completed: container %s on %s, access URL http://%s:%s/",
+                        deployment.deployment_name, container_name, vps.ip_address, vps.ip_address, deployment.port)
 
         except Exception as e:
             logger.error(f"Container deployment failed: {e}")
+            await self._wait_for_progress()
             deployment.status = "failed"
             deployment.error_message = str(e)
             deployment.completed_at = datetime.now(timezone.utc)
@@ -689,38 +776,30 @@ limit_time_real_cron = 1200
                               db_port: int, db_user: str, db_password: str, db_name: str):
         """Create a new database on PostgreSQL server"""
         try:
-            # Set PostgreSQL connection environment
-            pg_env = f"PGPASSWORD='{db_password}'"
-
             # Create database command with proper template and encoding
-            create_db_cmd = f"{pg_env} createdb -h {db_host} -p {db_port} -U {db_user} -T template0 -E UTF8 --locale=C --lc-collate=C --lc-ctype=C {db_name}"
+            connect = f"-h {shlex.quote(db_host)} -p {int(db_port)} -U {shlex.quote(db_user)}"
+            create_db_cmd = (
+                f"{PG_PASSWORD_FROM_STDIN}createdb {connect} -T template0 -E UTF8 "
+                f"--locale=C --lc-collate=C --lc-ctype=C {shlex.quote(db_name)}"
+            )
 
-            print("#########################################")
-            print("CREATING UNIQUE DATABASE:")
-            print(f"Database Host: {db_host}:{db_port}")
-            print(f"Database Name: {db_name}")
-            print(f"Database User: {db_user}")
-            print(f"Command: createdb -h {db_host} -p {db_port} -U {db_user} {db_name}")
-            print("#########################################")
+            logger.debug("Creating database %s on %s:%s as %s", db_name, db_host, db_port, db_user)
 
-            result = await self.ssh_service.execute_command(vps_id, create_db_cmd, host_info=host_info)
+            result = await self.ssh_service.execute_command(vps_id, create_db_cmd, host_info=host_info,
+                                                            stdin=f"{db_password}\n")
 
-            print("#########################################")
-            print("DATABASE CREATION RESULT:")
-            print(f"Success: {result.get('success', False)}")
-            print(f"STDOUT: {result.get('stdout', '')}")
-            print(f"STDERR: {result.get('stderr', '')}")
-            print("#########################################")
+            logger.debug("Database creation result success=%s stdout=%s stderr=%s",
+                         result.get('success', False), result.get('stdout', ''), result.get('stderr', ''))
 
             if not result.get("success"):
                 error_msg = result.get('stderr', 'Unknown error')
                 # Check if database already exists (not a fatal error)
                 if "already exists" in error_msg.lower():
-                    print(f"Database {db_name} already exists - continuing")
+                    logger.info(f"Database {db_name} already exists - continuing")
                 else:
                     raise Exception(f"Failed to create database {db_name}: {error_msg}")
             else:
-                print(f"Database {db_name} created successfully!")
+                logger.debug("Database %s created", db_name)
 
             # Configure database settings for Odoo compatibility
             await self._configure_database_settings(vps_id, host_info, db_host, db_port, db_user, db_password, db_name)
@@ -735,9 +814,6 @@ limit_time_real_cron = 1200
                                           db_port: int, db_user: str, db_password: str, db_name: str):
         """Configure database settings for better Odoo compatibility"""
         try:
-            # Set PostgreSQL connection environment
-            pg_env = f"PGPASSWORD='{db_password}'"
-
             # SQL commands to optimize database for Odoo
             sql_commands = [
                 f"ALTER DATABASE {db_name} SET lock_timeout = '30s';",
@@ -747,100 +823,77 @@ limit_time_real_cron = 1200
                 f"ALTER DATABASE {db_name} SET deadlock_timeout = '1s';"
             ]
 
-            print("#########################################")
-            print("CONFIGURING DATABASE SETTINGS FOR ODOO:")
-            print(f"Database: {db_name}")
-            print("Setting lock_timeout, statement_timeout, and other parameters")
-            print("#########################################")
+            logger.debug("Configuring database settings for %s", db_name)
 
             for sql_cmd in sql_commands:
                 # Execute SQL command via psql
-                psql_cmd = f"{pg_env} psql -h {db_host} -p {db_port} -U {db_user} -d {db_name} -c \"{sql_cmd}\""
+                psql_cmd = (
+                    f"{PG_PASSWORD_FROM_STDIN}psql -h {shlex.quote(db_host)} -p {int(db_port)} "
+                    f"-U {shlex.quote(db_user)} -d {shlex.quote(db_name)} -c {shlex.quote(sql_cmd)}"
+                )
 
-                result = await self.ssh_service.execute_command(vps_id, psql_cmd, host_info=host_info)
+                result = await self.ssh_service.execute_command(vps_id, psql_cmd, host_info=host_info,
+                                                                stdin=f"{db_password}\n")
 
                 if result.get("success"):
-                    print(f"✓ Executed: {sql_cmd}")
+                    logger.debug("Executed on %s: %s", db_name, sql_cmd)
                 else:
-                    print(f"⚠ Failed: {sql_cmd} - {result.get('stderr', '')}")
-
-            print("#########################################")
-            print("DATABASE CONFIGURATION COMPLETED")
-            print("#########################################")
+                    logger.warning(f"Failed on {db_name}: {sql_cmd} - {result.get('stderr', '')}")
 
         except Exception as e:
             logger.warning(f"Failed to configure database settings for {db_name}: {e}")
             # Don't fail the deployment for configuration issues
 
-    async def _copy_backup_to_vps(self, local_path: str, remote_path: str, host_info: dict):
+    async def _copy_backup_to_vps(self, vps_id: str, local_path: str, remote_path: str, host_info: dict):
         """Copy backup file from local storage to VPS"""
-        # This would use SCP or SFTP to copy the file
-        # For now, we'll simulate it
         logger.info(f"Copying backup from {local_path} to {remote_path}")
-        # Implementation would depend on your file transfer method
+
+        result = await self.ssh_service.upload_file(vps_id, local_path, remote_path, host_info=host_info)
+        if not result.get("success"):
+            raise Exception(f"Failed to copy backup to VPS: {result.get('error', 'Unknown error')}")
     
     async def _wait_for_container_ready(self, vps_id: str, container_name: str, host_info: dict,
                                        timeout: int = 300):
         """Wait for container to be ready"""
-        start_time = datetime.now()
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        wait_seconds = CONTAINER_READY_INITIAL_WAIT_SECONDS
+        retry_delay = CONTAINER_READY_INITIAL_RETRY_DELAY
         check_count = 0
 
-        while (datetime.now() - start_time).seconds < timeout:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
             check_count += 1
+            wait_seconds = min(wait_seconds, max(1, int(remaining)))
+
+            # One round-trip checks the status and, if the container is not up yet,
+            # blocks on the VPS until it starts or the wait runs out
+            check_started = loop.time()
+            result = await self.ssh_service.execute_command(
+                vps_id, "bash -s", timeout=wait_seconds + 30, host_info=host_info,
+                stdin=_CONTAINER_READY_SCRIPT.substitute(name=container_name, wait=wait_seconds)
+            )
+            output_lines = result.get("stdout", "").strip().splitlines()
+            status = output_lines[-1] if output_lines else ""
 
-            # Check if container is running
-            check_cmd = f"docker ps --filter name={container_name} --format json"
+            logger.debug("Container %s readiness check #%s: status=%r stderr=%s",
+                         container_name, check_count, status, result.get("stderr", ""))
 
-            print("#########################################")
-            print(f"CONTAINER READINESS CHECK #{check_count}:")
-            print(f"Command: {check_cmd}")
-            print("#########################################")
+            running, _, health = status.partition("|")
+            if running == "true" and health in ("", "healthy"):
+                logger.info(f"Container {container_name} is ready")
+                return
 
-            result = await self.ssh_service.execute_command(vps_id, check_cmd, host_info=host_info)
+            # A check that came back before its wait ran out either failed or saw a
+            # start that did not stick (e.g. a restart loop); back off with jitter
+            # rather than immediately asking again
+            if loop.time() - check_started < wait_seconds:
+                await asyncio.sleep(retry_delay + random.uniform(0, retry_delay))
+                retry_delay = min(retry_delay * 2, CONTAINER_READY_MAX_RETRY_DELAY)
 
-            print("#########################################")
-            print(f"CONTAINER STATUS CHECK RESULT #{check_count}:")
-            print(f"Success: {result.get('success', False)}")
-            print(f"STDOUT: {result.get('stdout', '')}")
-            print(f"STDERR: {result.get('stderr', '')}")
-            print("#########################################")
-
-            if result.get("success") and result.get("stdout"):
-                try:
-                    container_info = json.loads(result["stdout"])
-                    status = container_info.get("Status", "")
-
-                    print("#########################################")
-                    print(f"CONTAINER STATUS ANALYSIS:")
-                    print(f"Raw Status: {status}")
-                    print(f"Container Running: {'Up' in status}")
-                    print("#########################################")
-
-                    if "Up" in status:
-                        print("#########################################")
-                        print(f"CONTAINER {container_name} IS READY!")
-                        print(f"Final Status: {status}")
-                        print("#########################################")
-                        logger.info(f"Container {container_name} is ready")
-                        return
-                except json.JSONDecodeError as e:
-                    print("#########################################")
-                    print(f"JSON DECODE ERROR: {e}")
-                    print(f"Raw output: {result.get('stdout', '')}")
-                    print("#########################################")
-
-            print("#########################################")
-            print(f"CONTAINER NOT READY YET - WAITING 10 seconds...")
-            print(f"Elapsed time: {(datetime.now() - start_time).seconds} seconds")
-            print(f"Timeout: {timeout} seconds")
-            print("#########################################")
-
-            await asyncio.sleep(10)
-
-        print("#########################################")
-        print(f"CONTAINER READINESS TIMEOUT!")
-        print(f"Container {container_name} not ready within {timeout} seconds")
-        print("#########################################")
+            wait_seconds = min(wait_seconds * 2, CONTAINER_READY_MAX_WAIT_SECONDS)
 
         raise Exception(f"Container {container_name} not ready within {timeout} seconds")
     
@@ -848,13 +901,13 @@ limit_time_real_cron = 1200
                              backup_path: str, host_info: dict):
         """Restore database backup to the container"""
         try:
-            # Create database in container
-            create_db_cmd = f"docker exec {container_name} createdb -U odoo {db_name}"
-            result = await self.ssh_service.execute_command(vps_id, create_db_cmd, host_info=host_info)
-
-            # Restore backup
-            restore_cmd = f"docker exec {container_name} pg_restore -U odoo -d {db_name} {backup_path}"
-            result = await self.ssh_service.execute_command(vps_id, restore_cmd, host_info=host_info)
+            # Create the database and restore into it with one docker exec
+            db, backup = shlex.quote(db_name), shlex.quote(backup_path)
+            restore_cmd = (
+                f"docker exec {container_name} sh -c "
+                + shlex.quote(f"createdb -U odoo {db}; exec pg_restore -U odoo -d {db} {backup}")
+            )
+            result = await self.ssh_service.execute_command_streaming(vps_id, restore_cmd, host_info=host_info)
 
             if not result.get("success"):
                 logger.warning(f"Backup restore may have failed: {result.get('stderr', '')}")
@@ -869,66 +922,42 @@ limit_time_real_cron = 1200
                                      db_port: int, db_user: str, db_password: str):
         """Restore database backup to external PostgreSQL"""
         try:
-            # Set PostgreSQL connection environment for the commands
-            pg_env = f"PGPASSWORD='{db_password}'"
-
-            # Create database on external PostgreSQL if it doesn't exist
-            create_db_cmd = f"{pg_env} createdb -h {db_host} -p {db_port} -U {db_user} {db_name} || true"
-
-            print("#########################################")
-            print("CREATING DATABASE ON EXTERNAL POSTGRESQL:")
-            print(f"Host: {db_host}:{db_port}")
-            print(f"Database: {db_name}")
-            print(f"User: {db_user}")
-            print(f"Command: {create_db_cmd}")
-            print("#########################################")
-
-            result = await self.ssh_service.execute_command(vps_id, create_db_cmd, host_info=host_info)
-
-            print("#########################################")
-            print("DATABASE CREATION RESULT:")
-            print(f"Success: {result.get('success', False)}")
-            print(f"STDOUT: {result.get('stdout', '')}")
-            print(f"STDERR: {result.get('stderr', '')}")
-            print("#########################################")
-
-            # Restore backup to external PostgreSQL
-            restore_cmd = f"{pg_env} pg_restore -h {db_host} -p {db_port} -U {db_user} -d {db_name} {backup_path}"
-
-            print("#########################################")
-            print("RESTORING BACKUP TO EXTERNAL POSTGRESQL:")
-            print(f"Backup File: {backup_path}")
-            print(f"Target: {db_host}:{db_port}/{db_name}")
-            print(f"Command: {restore_cmd}")
-            print("#########################################")
-
-            result = await self.ssh_service.execute_command(vps_id, restore_cmd, host_info=host_info)
-
-            print("#########################################")
-            print("BACKUP RESTORATION RESULT:")
-            print(f"Success: {result.get('success', False)}")
-            print(f"STDOUT: {result.get('stdout', '')}")
-            print(f"STDERR: {result.get('stderr', '')}")
-            print("#########################################")
+            # Create the database if it doesn't exist and restore into it in one
+            # round-trip; the marker on stderr separates the two phases' output
+            connect = f"-h {shlex.quote(db_host)} -p {int(db_port)} -U {shlex.quote(db_user)}"
+            db, backup = shlex.quote(db_name), shlex.quote(backup_path)
+            # Custom-format archives (PGDMP header) restore with one job per core;
+            # other archive formats restore serially and plain SQL dumps go to psql.
+            # Tenant roles differ from the dump's, so ownership and grants are skipped
+            restore_opts = f"{connect} -d {db} --no-owner --no-privileges"
+            restore_cmd = f"{PG_PASSWORD_FROM_STDIN}sh -c " + shlex.quote(
+                f"createdb {connect} {db} || true; "
+                f"echo {RESTORE_PHASE_MARKER} >&2; "
+                f"if [ \"$(head -c 5 {backup})\" = PGDMP ]; then "
+                f"exec pg_restore -j \"$(nproc)\" {restore_opts} {backup}; "
+                f"elif pg_restore -l {backup} >/dev/null 2>&1; then "
+                f"exec pg_restore {restore_opts} {backup}; "
+                f"else exec psql -q {connect} -d {db} -f {backup}; fi"
+            )
+
+            logger.debug("Creating database %s on %s:%s as %s if missing and restoring %s",
+                         db_name, db_host, db_port, db_user, backup_path)
+
+            result = await self.ssh_service.execute_command_streaming(vps_id, restore_cmd, host_info=host_info,
+                                                                      stdin=f"{db_password}\n")
+
+            createdb_stderr, _, restore_stderr = result.get('stderr', '').rpartition(RESTORE_PHASE_MARKER)
+            logger.debug("Database creation stderr=%s", createdb_stderr.strip())
+            logger.debug("Backup restoration result success=%s stdout=%s stderr=%s",
+                         result.get('success', False), result.get('stdout', ''), restore_stderr.strip())
 
             if not result.get("success"):
-                logger.warning(f"External backup restore may have failed: {result.get('stderr', '')}")
-                print("#########################################")
-                print("WARNING: BACKUP RESTORATION MAY HAVE FAILED")
-                print(f"Error: {result.get('stderr', '')}")
-                print("#########################################")
+                logger.warning(f"External backup restore may have failed: {restore_stderr.strip()}")
             else:
-                print("#########################################")
-                print("BACKUP RESTORATION SUCCESSFUL!")
-                print(f"Database {db_name} restored successfully")
-                print("#########################################")
+                logger.debug("Database %s restored", db_name)
 
             logger.info(f"Backup restored to external PostgreSQL: {db_host}:{db_port}/{db_name}")
         except Exception as e:
-            print("#########################################")
-            print("BACKUP RESTORATION ERROR:")
-            print(f"Exception: {str(e)}")
-            print("#########################################")
             logger.error(f"Failed to restore backup to external PostgreSQL: {e}")
             # Don't fail deployment for backup restore issues
     
@@ -936,31 +965,23 @@ limit_time_real_cron = 1200
                              page: int = 1, per_page: int = 20) -> Dict[str, Any]:
         """Get deployments with filtering"""
         try:
-            query = select(OdooDeployment)
-            
+            filters = []
             if vps_id:
-                query = query.where(OdooDeployment.vps_id == vps_id)
+                filters.append(OdooDeployment.vps_id == vps_id)
             if status:
-                query = query.where(OdooDeployment.status == status)
+                filters.append(OdooDeployment.status == status)
             
             # Add pagination
             offset = (page - 1) * per_page
+            query = select(OdooDeployment).where(*filters)
             query = query.offset(offset).limit(per_page)
             query = query.order_by(OdooDeployment.created_at.desc())
             
-            result = await self.db.execute(query)
+            # Get total count alongside the page, on a session of its own
+            count_query = select(func.count()).select_from(OdooDeployment).where(*filters)
+            result, total = await asyncio.gather(self.db.execute(query), _count_rows(count_query))
             deployments = result.scalars().all()
             
-            # Get total count
-            count_query = select(OdooDeployment)
-            if vps_id:
-                count_query = count_query.where(OdooDeployment.vps_id == vps_id)
-            if status:
-                count_query = count_query.where(OdooDeployment.status == status)
-            
-            count_result = await self.db.execute(count_query)
-            total = len(count_result.scalars().all())
-            
             return {
                 "deployments": deployments,
                 "total": total,
@@ -974,57 +995,70 @@ limit_time_real_cron = 1200
     async def get_deployment(self, deployment_id: str) -> Optional[OdooDeployment]:
         """Get specific deployment"""
         try:
-            query = select(OdooDeployment).where(OdooDeployment.id == deployment_id)
-            result = await self.db.execute(query)
-            return result.scalar_one_or_none()
+            return await self.db.get(OdooDeployment, _as_uuid(deployment_id))
         except Exception as e:
             logger.error(f"Failed to get deployment {deployment_id}: {e}")
             return None
     
+    async def _get_host_info(self, vps_id) -> Optional[Dict[str, Any]]:
+        """Get VPS connection details, reusing lookups made in the last minute"""
+        cached = _host_info_cache.get(str(vps_id))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        vps = await self.db.get(VPSHost, _as_uuid(vps_id))
+        if not vps:
+            invalidate_host_info(vps_id)
+            return None
+        return _build_host_info(vps)
+    
     async def delete_deployment(self, deployment_id: str, admin_id: str) -> bool:
         """Delete a deployment and its associated container"""
+        ssh_task = None
         try:
             deployment = await self.get_deployment(deployment_id)
             if not deployment:
                 return False
             
-            # Get VPS info
-            vps_query = select(VPSHost).where(VPSHost.id == deployment.vps_id)
-            vps_result = await self.db.execute(vps_query)
-            vps = vps_result.scalar_one_or_none()
+            host_info = await self._get_host_info(deployment.vps_id)
             
-            if vps:
-                # Stop and remove container if exists
-                host_info = {
-                    'ip_address': vps.ip_address,
-                    'port': vps.port,
-                    'username': vps.username,
-                    'password_encrypted': vps.password_encrypted,
-                    'private_key_encrypted': vps.private_key_encrypted
-                }
-                
-                container_name = f"odoo_{deployment.deployment_name.lower().replace('-', '_').replace(' ', '_')}"
+            if host_info:
+                # Stop and remove the container while the rows are deleted
+                container_name = f"odoo_{deployment.deployment_name}"
                 
-                # Remove container
-                await self.ssh_service.execute_command(
-                    vps.id, f"docker stop {container_name} && docker rm {container_name}", 
+                ssh_task = asyncio.create_task(self.ssh_service.execute_command(
+                    deployment.vps_id,
+                    f"docker rm -f {container_name}; "
+                    f"rm -f {ODOO_SECRETS_DIR}/{container_name}.conf {ODOO_SECRETS_DIR}/{container_name}.env "
+                    f"/tmp/odoo_{container_name}.conf",
                     host_info=host_info
-                )
+                ))
             
-            # Delete associated OdooInstance if exists
+            # Delete the deployment and its OdooInstance in one transaction
             if deployment.instance_id:
-                instance_query = select(OdooInstance).where(OdooInstance.id == deployment.instance_id)
-                instance_result = await self.db.execute(instance_query)
-                instance = instance_result.scalar_one_or_none()
-                if instance:
-                    await self.db.delete(instance)
-            
-            # Delete deployment
-            await self.db.delete(deployment)
+                await self.db.execute(
+                    delete(OdooInstance).where(OdooInstance.id == deployment.instance_id)
+                )
+            await self.db.execute(
+                delete(OdooDeployment).where(OdooDeployment.id == deployment.id)
+            )
             await self.db.commit()
-            
-            return True
         except Exception as e:
             logger.error(f"Failed to delete deployment {deployment_id}: {e}")
             await self.db.rollback()
+            if ssh_task:
+                ssh_task.cancel()
             return False
+        
+        if ssh_task:
+            try:
+                result = await ssh_task
+                if not result.get('success'):
+                    logger.warning(
+                        f"Container removal for deployment {deployment_id} failed: "
+                        f"{result.get('stderr') or result.get('error')}"
+                    )
+            except Exception as e:
+                logger.warning(f"Container removal for deployment {deployment_id} failed: {e}")
+        
+        return True
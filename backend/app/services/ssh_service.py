@@ -1,23 +1,153 @@
 import paramiko
 import asyncio
 import logging
-from typing import Dict, Optional, List, Any
+import io
+import os
+import time
+import hashlib
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Optional, List, Any, Tuple
 from datetime import datetime
 from app.core.security import decrypt_data, sanitize_error_message, generate_secure_token
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# SSH connections shared by all SSHService instances, so the handshake is paid once
+# per VPS rather than once per request. Connections idle for longer than
+# SSH_CONNECTION_IDLE_TIMEOUT are closed.
+_connections: Dict[str, paramiko.SSHClient] = {}
+_last_used: Dict[str, float] = {}
+# Kept per event loop, since an asyncio.Lock is bound to the loop it is first used
+# on and Celery tasks run each task on a fresh loop (asyncio.run)
+_connect_locks: Dict[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]] = {}
+# Operations currently running on each pooled connection; a connection in use is
+# never closed as idle
+_in_use: Dict[str, int] = {}
+
+# Chunk size for streamed uploads. Paramiko splits each write into SFTP packets and,
+# with pipelining enabled, keeps them in flight instead of waiting for every ack.
+SFTP_UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Streamed commands read their output in chunks of STREAM_READ_CHUNK_SIZE, keep only
+# the last STREAM_TAIL_BYTES of it, and log every STREAM_LOG_EVERY_LINES-th line
+STREAM_READ_CHUNK_SIZE = 32 * 1024
+STREAM_TAIL_BYTES = 8192
+STREAM_LOG_EVERY_LINES = 1000
+
+
+def _read_tail(recv, tail_bytes: int, label: str) -> bytes:
+    """Read a channel stream to EOF, keeping only its last `tail_bytes`.
+    
+    `recv` is Channel.recv or Channel.recv_stderr; it returns b"" once the remote
+    side has closed the stream.
+    """
+    tail: deque = deque()
+    size = 0
+    line_count = 0
+    while True:
+        chunk = recv(STREAM_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        previous_count = line_count
+        line_count += chunk.count(b"\n")
+        if line_count // STREAM_LOG_EVERY_LINES > previous_count // STREAM_LOG_EVERY_LINES:
+            logger.debug("%s line %d: %s", label, line_count,
+                         chunk.rstrip(b"\n").rpartition(b"\n")[2].decode('utf-8', errors='replace'))
+        tail.append(chunk)
+        size += len(chunk)
+        while size - len(tail[0]) >= tail_bytes:
+            size -= len(tail.popleft())
+    return b"".join(tail)[-tail_bytes:]
+
+
+def _get_connect_lock(vps_id: str) -> asyncio.Lock:
+    """The connect lock of a VPS for the running event loop"""
+    loop = asyncio.get_running_loop()
+    loop_locks = _connect_locks.get(loop)
+    if loop_locks is None:
+        # Drop the locks of loops that have finished, e.g. earlier Celery tasks;
+        # each lock holds on to its loop
+        for closed_loop in [l for l in _connect_locks if l.is_closed()]:
+            del _connect_locks[closed_loop]
+        loop_locks = _connect_locks[loop] = {}
+    return loop_locks.setdefault(vps_id, asyncio.Lock())
+
+
+def _has_open_channels(client: paramiko.SSHClient) -> bool:
+    """Whether a live connection still has channels (commands, SFTP sessions) open"""
+    transport = client.get_transport()
+    if transport is None or not transport.is_active():
+        return False
+    # paramiko keeps open channels in Transport._channels and drops them on close
+    channels = getattr(transport, "_channels", None)
+    return bool(channels is not None and channels.values())
+
+
+@lru_cache(maxsize=128)
+def _decrypt_credentials(
+    password_encrypted: Optional[str],
+    private_key_encrypted: Optional[str]
+) -> Tuple[Optional[str], Optional[paramiko.PKey]]:
+    """Decrypt a VPS password and parse its private key.
+    
+    Cached on the ciphertext, so reconnects skip the decryption and key parsing
+    while changed credentials simply miss the cache.
+    """
+    password = None
+    private_key = None
+    
+    if password_encrypted:
+        password = decrypt_data(password_encrypted)
+    
+    if private_key_encrypted:
+        private_key_str = decrypt_data(private_key_encrypted)
+        private_key = paramiko.RSAKey.from_private_key(io.StringIO(private_key_str))
+    
+    return password, private_key
+
 
 class SSHService:
     """Service for managing SSH connections and remote operations"""
     
     def __init__(self):
-        self.connections = {}  # Cache for SSH connections
+        self.connections = _connections  # Cache for SSH connections
         self.connection_timeout = settings.SSH_TIMEOUT
     
     async def get_connection(self, vps_id: str, host_info: Dict[str, Any]) -> paramiko.SSHClient:
         """Get or create SSH connection to VPS"""
+        self._close_idle_connections(exclude=vps_id)
+        
+        # One connection attempt per VPS at a time; concurrent callers reuse its result
+        lock = _get_connect_lock(vps_id)
+        async with lock:
+            client = await self._get_or_connect(vps_id, host_info)
+        _last_used[vps_id] = time.monotonic()
+        return client
+    
+    @asynccontextmanager
+    async def _lease_connection(self, vps_id: str, host_info: Dict[str, Any]):
+        """Hold a pooled connection for one operation.
+        
+        The connection counts as in use until the block exits, and its idle time is
+        measured from then rather than from when it was handed out.
+        """
+        client = await self.get_connection(vps_id, host_info)
+        _in_use[vps_id] = _in_use.get(vps_id, 0) + 1
+        try:
+            yield client
+        finally:
+            remaining = _in_use.get(vps_id, 0) - 1
+            if remaining > 0:
+                _in_use[vps_id] = remaining
+            else:
+                _in_use.pop(vps_id, None)
+            _last_used[vps_id] = time.monotonic()
+    
+    async def _get_or_connect(self, vps_id: str, host_info: Dict[str, Any]) -> paramiko.SSHClient:
+        """Return the cached connection if it is still alive, otherwise connect"""
         
         # Check if we have a cached connection
         if vps_id in self.connections:
@@ -41,16 +171,9 @@ class SSHService:
         
         try:
             # Decrypt credentials if needed
-            password = None
-            private_key = None
-            
-            if host_info.get('password_encrypted'):
-                password = decrypt_data(host_info['password_encrypted'])
-            
-            if host_info.get('private_key_encrypted'):
-                private_key_str = decrypt_data(host_info['private_key_encrypted'])
-                from io import StringIO
-                private_key = paramiko.RSAKey.from_private_key(StringIO(private_key_str))
+            password, private_key = _decrypt_credentials(
+                host_info.get('password_encrypted'), host_info.get('private_key_encrypted')
+            )
             
             # Connect
             await asyncio.get_event_loop().run_in_executor(
@@ -83,9 +206,10 @@ class SSHService:
         vps_id: str, 
         command: str, 
         timeout: int = 300,
-        host_info: Optional[Dict[str, Any]] = None
+        host_info: Optional[Dict[str, Any]] = None,
+        stdin: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Execute command on remote VPS"""
+        """Execute command on remote VPS, optionally feeding `stdin` to it"""
         
         task_id = generate_secure_token(8)
         
@@ -94,32 +218,97 @@ class SSHService:
                 # This would normally fetch from database
                 raise ValueError("Host info required for new connections")
             
-            client = await self.get_connection(vps_id, host_info)
+            async with self._lease_connection(vps_id, host_info) as client:
+                # Execute command
+                def _exec():
+                    channel_stdin, channel_stdout, channel_stderr = client.exec_command(command, timeout=timeout)
+                    if stdin is not None:
+                        channel_stdin.write(stdin)
+                        channel_stdin.channel.shutdown_write()
+                    return channel_stdout, channel_stderr
             
-            # Execute command
-            stdin, stdout, stderr = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: client.exec_command(command, timeout=timeout)
-            )
+                stdout, stderr = await asyncio.get_event_loop().run_in_executor(None, _exec)
             
-            # Read output
-            stdout_data = await asyncio.get_event_loop().run_in_executor(
-                None, stdout.read
-            )
-            stderr_data = await asyncio.get_event_loop().run_in_executor(
-                None, stderr.read
-            )
+                # Read output
+                stdout_data = await asyncio.get_event_loop().run_in_executor(
+                    None, stdout.read
+                )
+                stderr_data = await asyncio.get_event_loop().run_in_executor(
+                    None, stderr.read
+                )
             
-            exit_code = stdout.channel.recv_exit_status()
+                exit_code = stdout.channel.recv_exit_status()
             
+                return {
+                    "success": exit_code == 0,
+                    "exit_code": exit_code,
+                    "stdout": stdout_data.decode('utf-8', errors='replace'),
+                    "stderr": stderr_data.decode('utf-8', errors='replace'),
+                    "task_id": task_id
+                }
+
+        except Exception as e:
+            error_msg = sanitize_error_message(str(e), task_id)
             return {
-                "success": exit_code == 0,
-                "exit_code": exit_code,
-                "stdout": stdout_data.decode('utf-8', errors='replace'),
-                "stderr": stderr_data.decode('utf-8', errors='replace'),
+                "success": False,
+                "exit_code": -1,
+                "stdout": "",
+                "stderr": error_msg["error"],
                 "task_id": task_id
             }
+    
+    async def execute_command_streaming(
+        self,
+        vps_id: str,
+        command: str,
+        timeout: int = 300,
+        host_info: Optional[Dict[str, Any]] = None,
+        stdin: Optional[str] = None,
+        tail_bytes: int = STREAM_TAIL_BYTES
+    ) -> Dict[str, Any]:
+        """Execute a command with verbose output on remote VPS.
+        
+        Like execute_command, but stdout and stderr are consumed as they arrive and
+        only their last `tail_bytes` are returned, so memory stays bounded however
+        much the command prints.
+        """
+        
+        task_id = generate_secure_token(8)
+        
+        try:
+            if not host_info:
+                raise ValueError("Host info required for new connections")
+            
+            async with self._lease_connection(vps_id, host_info) as client:
+                def _exec():
+                    channel_stdin, channel_stdout, _ = client.exec_command(command, timeout=timeout)
+                    if stdin is not None:
+                        channel_stdin.write(stdin)
+                        channel_stdin.channel.shutdown_write()
+                    return channel_stdout.channel
+            
+                loop = asyncio.get_event_loop()
+                channel = await loop.run_in_executor(None, _exec)
+            
+                # Drain both streams at once, as raw bytes from the channel, so neither
+                # backs up in paramiko's buffers
+                stdout_data, stderr_data = await asyncio.gather(
+                    loop.run_in_executor(None, _read_tail, channel.recv, tail_bytes,
+                                         f"[{task_id}] stdout"),
+                    loop.run_in_executor(None, _read_tail, channel.recv_stderr, tail_bytes,
+                                         f"[{task_id}] stderr")
+                )
             
+                exit_code = channel.recv_exit_status()
+            
+                return {
+                    "success": exit_code == 0,
+                    "exit_code": exit_code,
+                    "stdout": stdout_data.decode('utf-8', errors='replace'),
+                    "stderr": stderr_data.decode('utf-8', errors='replace'),
+                    "task_id": task_id
+                }
+
         except Exception as e:
             error_msg = sanitize_error_message(str(e), task_id)
             return {
@@ -146,48 +335,103 @@ class SSHService:
             if not host_info:
                 raise ValueError("Host info required for new connections")
             
-            client = await self.get_connection(vps_id, host_info)
-            
-            # Use SFTP to write file
-            sftp = client.open_sftp()
-            
-            # Write file
-            await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: sftp.put(
-                    localpath=None,  # We'll use file-like object
-                    remotepath=remote_path
-                )
-            )
-            
-            # Actually write using a temporary local approach for safety
-            import tempfile
-            import os
-            
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8') as tmp_file:
-                tmp_file.write(content)
-                tmp_file_path = tmp_file.name
-            
-            try:
-                await asyncio.get_event_loop().run_in_executor(
-                    None, sftp.put, tmp_file_path, remote_path
-                )
-                
-                # Set file permissions
-                await asyncio.get_event_loop().run_in_executor(
-                    None, sftp.chmod, remote_path, int(mode, 8)
-                )
-                
-            finally:
-                os.unlink(tmp_file_path)
-                sftp.close()
+            async with self._lease_connection(vps_id, host_info) as client:
+                # Upload from memory to a temporary file next to the target, then
+                # rename it into place so readers never see a partially written file
+                tmp_path = f"{remote_path}.tmp.{task_id}"
+                data = content.encode('utf-8')
+            
+                def _upload():
+                    sftp = client.open_sftp()
+                    try:
+                        sftp.putfo(io.BytesIO(data), tmp_path)
+                        sftp.chmod(tmp_path, int(mode, 8))
+                        sftp.posix_rename(tmp_path, remote_path)
+                    except Exception:
+                        try:
+                            sftp.remove(tmp_path)
+                        except IOError:
+                            pass
+                        raise
+                    finally:
+                        sftp.close()
+            
+                await asyncio.get_event_loop().run_in_executor(None, _upload)
             
+                return {
+                    "success": True,
+                    "message": f"File written to {remote_path}",
+                    "task_id": task_id
+                }
+
+        except Exception as e:
+            error_msg = sanitize_error_message(str(e), task_id)
             return {
-                "success": True,
-                "message": f"File written to {remote_path}",
+                "success": False,
+                "error": error_msg["error"],
                 "task_id": task_id
             }
+    
+    async def upload_file(
+        self,
+        vps_id: str,
+        local_path: str,
+        remote_path: str,
+        host_info: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Stream a local file to the remote VPS and verify its SHA-256 checksum"""
+        
+        task_id = generate_secure_token(8)
+        
+        try:
+            if not host_info:
+                raise ValueError("Host info required for new connections")
+            
+            async with self._lease_connection(vps_id, host_info) as client:
+                tmp_path = f"{remote_path}.tmp.{task_id}"
+            
+                def _upload() -> str:
+                    digest = hashlib.sha256()
+                    sftp = client.open_sftp()
+                    try:
+                        # Unbuffered reads go straight into each chunk, and sequential
+                        # readahead lets the kernel load the next chunks from disk while
+                        # the current one is on the wire. The SSH transport encrypts in
+                        # user space, so there is no socket to sendfile() into.
+                        with open(local_path, 'rb', buffering=0) as local_file, sftp.file(tmp_path, 'wb') as remote_file:
+                            if hasattr(os, 'posix_fadvise'):
+                                os.posix_fadvise(local_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                            remote_file.set_pipelined(True)
+                            for chunk in iter(lambda: local_file.read(SFTP_UPLOAD_CHUNK_SIZE), b''):
+                                digest.update(chunk)
+                                remote_file.write(chunk)
+                    
+                        # Compare against the remote copy before moving it into place
+                        _, stdout, _ = client.exec_command(f"sha256sum {tmp_path}", timeout=self.connection_timeout)
+                        remote_digest = stdout.read().decode('utf-8', errors='replace').split(' ', 1)[0]
+                        if remote_digest != digest.hexdigest():
+                            raise IOError(f"Checksum mismatch after uploading {local_path}")
+                    
+                        sftp.posix_rename(tmp_path, remote_path)
+                        return remote_digest
+                    except Exception:
+                        try:
+                            sftp.remove(tmp_path)
+                        except IOError:
+                            pass
+                        raise
+                    finally:
+                        sftp.close()
+            
+                checksum = await asyncio.get_event_loop().run_in_executor(None, _upload)
             
+                return {
+                    "success": True,
+                    "message": f"File uploaded to {remote_path}",
+                    "sha256": checksum,
+                    "task_id": task_id
+                }
+
         except Exception as e:
             error_msg = sanitize_error_message(str(e), task_id)
             return {
@@ -210,27 +454,26 @@ class SSHService:
             if not host_info:
                 raise ValueError("Host info required for new connections")
             
-            client = await self.get_connection(vps_id, host_info)
+            async with self._lease_connection(vps_id, host_info) as client:
+                # Use SFTP to read file
+                sftp = client.open_sftp()
             
-            # Use SFTP to read file
-            sftp = client.open_sftp()
-            
-            try:
-                # Read file
-                with sftp.file(remote_path, 'r') as remote_file:
-                    content = await asyncio.get_event_loop().run_in_executor(
-                        None, remote_file.read
-                    )
+                try:
+                    # Read file
+                    with sftp.file(remote_path, 'r') as remote_file:
+                        content = await asyncio.get_event_loop().run_in_executor(
+                            None, remote_file.read
+                        )
                 
-                return {
-                    "success": True,
-                    "content": content.decode('utf-8', errors='replace'),
-                    "task_id": task_id
-                }
+                    return {
+                        "success": True,
+                        "content": content.decode('utf-8', errors='replace'),
+                        "task_id": task_id
+                    }
                 
-            finally:
-                sftp.close()
-            
+                finally:
+                    sftp.close()
+
         except Exception as e:
             error_msg = sanitize_error_message(str(e), task_id)
             return {
@@ -303,16 +546,9 @@ class SSHService:
         
         try:
             # Prepare credentials
-            password = None
-            private_key = None
-            
-            if host_info.get('password_encrypted'):
-                password = decrypt_data(host_info['password_encrypted'])
-            
-            if host_info.get('private_key_encrypted'):
-                private_key_str = decrypt_data(host_info['private_key_encrypted'])
-                from io import StringIO
-                private_key = paramiko.RSAKey.from_private_key(StringIO(private_key_str))
+            password, private_key = _decrypt_credentials(
+                host_info.get('password_encrypted'), host_info.get('private_key_encrypted')
+            )
             
             # Test connection
             await asyncio.get_event_loop().run_in_executor(
@@ -361,6 +597,23 @@ class SSHService:
             except:
                 pass
             del self.connections[vps_id]
+        _last_used.pop(vps_id, None)
+    
+    def _close_idle_connections(self, exclude: Optional[str] = None):
+        """Close cached connections that have not been used within the idle timeout.
+        
+        Connections with an operation still running on them, or with open channels
+        from callers that use get_connection directly, are kept however long ago
+        they were handed out.
+        """
+        cutoff = time.monotonic() - settings.SSH_CONNECTION_IDLE_TIMEOUT
+        for vps_id, last_used in list(_last_used.items()):
+            if last_used >= cutoff or vps_id == exclude or _in_use.get(vps_id):
+                continue
+            client = self.connections.get(vps_id)
+            if client is not None and _has_open_channels(client):
+                continue
+            self.close_connection(vps_id)
     
     def close_all_connections(self):
         """Close all cached SSH connections"""
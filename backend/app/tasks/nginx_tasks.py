@@ -3,6 +3,7 @@ from app.worker import celery_app
 from app.core.database import AsyncSessionLocal
 from app.services.nginx_config_service import NginxConfigService
 from app.services.audit_service import AuditService
+from app.services.ssh_service import SSHService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,8 +18,19 @@ def apply_nginx_config_task(config_id: str, author_id: str):
     return {"success": True, "config_id": config_id}
 
 
-@celery_app.task  
-def monitor_nginx_health_task(config_id: str, watch_window_seconds: int):
-    """Background task to monitor nginx health after config change"""
-    logger.info(f"Monitoring nginx health for config {config_id} for {watch_window_seconds} seconds")
-    return {"success": True, "config_id": config_id}
\ No newline at end of file
+@celery_app.task
+def monitor_nginx_health_task(config_id: str, task_id: str):
+    """Background task to check nginx health once a config's watch window has passed"""
+    import asyncio
+    logger.info(f"Checking nginx health for config {config_id}")
+    asyncio.run(_monitor_nginx_health(config_id, task_id))
+    return {"success": True, "config_id": config_id}
+
+
+async def _monitor_nginx_health(config_id: str, task_id: str):
+    """Run the health check and automatic rollback with a short-lived session"""
+    async with AsyncSessionLocal() as db:
+        nginx_service = NginxConfigService(
+            db, ssh_service=SSHService(), audit_service=AuditService(db)
+        )
+        await nginx_service.monitor_health_and_rollback(config_id, task_id)